@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#binary cache of the spreadsheets powGen reads on every job (turbine power curves, IEC wind class and offshore maps)
+#each workbook is parsed once into a .npz next to it, tagged with a hash of the workbook, and read from there until the workbook changes
+
+import numpy as np
+import hashlib
+import os
+
+def get_file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def get_cache_file_name(excel_file):
+    return excel_file + '.npz'
+
+def as_saveable(labels):
+    # row and column labels are kept as numbers or strings so the cache loads without pickle (None for labels of mixed types)
+    labels = np.asarray(labels)
+    if labels.dtype != object:
+        return labels
+    return labels.astype(str) if all(isinstance(label, str) for label in labels) else None
+
+def write_cache(cache_file, key, table):
+    # written to a temporary file first so array tasks regenerating the cache at the same time never read a partial file,
+    # tables with mixed text and numbers would need pickle to load and are not cached (False)
+    arrays = {'values': table.values, 'columns': as_saveable(table.columns), 'index': as_saveable(table.index)}
+    if any(values is None or values.dtype == object for values in arrays.values()):
+        return False
+    temp_file = '%s.%d.tmp.npz' % (cache_file[:-4], os.getpid())
+    np.savez(temp_file, key=key, **arrays)
+    os.replace(temp_file, cache_file)
+    return True
+
+def read_excel_cached(excel_file, index_col=None):
+    """ Reads a spreadsheet like pd.read_excel, from its binary cache when the workbook has not changed since the cache was written
+
+    ...
+
+    Args:
+    ----------
+    `excel_file` (str): file path of the .xlsx workbook
+
+    `index_col` (int): column used as row labels, as in pd.read_excel
+
+    Returns:
+    ----------
+    `table` (DataFrame): first sheet of the workbook
+    """
+    # imported here so importing asset_cache (e.g. for get_file_hash) doesn't load pandas
+    import pandas as pd
+    cache_file = get_cache_file_name(excel_file)
+    key = '%s:%s' % (get_file_hash(excel_file), index_col)
+
+    if os.path.isfile(cache_file):
+        try:
+            with np.load(cache_file) as cache:
+                if str(cache['key']) == key:
+                    return pd.DataFrame(cache['values'], index=cache['index'], columns=cache['columns'])
+        except ValueError:
+            # a cache of object arrays written before they were left out, read the workbook instead
+            pass
+
+    table = pd.read_excel(excel_file, index_col=index_col)
+    try:
+        write_cache(cache_file, key, table)
+    except OSError:
+        print('Could not write cache ' + cache_file + ', reading ' + excel_file + ' directly', flush=True)
+    return table
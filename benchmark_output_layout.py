@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#compares storage layouts of the cf output files: writes synthetic capacity factors the way powGen_impl_beta does (cell by cell in
+#tiles through CFWriter) with every combination of layout, quantization and compression, then times the two ways they are read,
+#hours across the whole region (capacity expansion models) and the whole year of single cells
+#usage: python benchmark_output_layout.py [--lats N] [--lons N] [--reads N] [--complevel N] [--output results.json]
+
+import numpy as np
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from netCDF4 import Dataset
+import powGen_impl_beta as powGen
+
+def get_synthetic_cf(num_cells, seed=0):
+    # a plausible mix of zero hours and smooth values, so compression behaves like on real outputs
+    rng = np.random.default_rng(seed)
+    hours = np.arange(8760)
+    daily = np.clip(np.sin(2 * np.pi * (hours % 24 - 6) / 24), 0, None)
+    return np.clip(daily[None, :] * rng.uniform(0.5, 1., (num_cells, 1)) + rng.normal(0, 0.02, (num_cells, 8760)), 0, 1)
+
+def write_outputs(destination, lats, lons, cf, chunk_shape, complevel, quantize, tile_size=256):
+    powGen.create_netCDF_files(2017, lats, lons, destination, chunk_shape, complevel, quantize=quantize)
+    cf_writer = powGen.CFWriter(2017, destination)
+    for tile_start, tile_stop in powGen.get_tiles(cf.shape[0], tile_size):
+        tile_lats, tile_lons = powGen.get_cell_indices(tile_start, tile_stop, lons.size)
+        for cell in range(tile_stop - tile_start):
+            cf_writer.add(tile_lats[cell], tile_lons[cell], cf[tile_start + cell], cf[tile_start + cell])
+        cf_writer.flush()
+    cf_writer.close()
+
+def time_reads(file_name, num_lats, num_lons, num_reads, seed=0):
+    # random hours (whole region) and random cells (whole year), each file is reopened so nothing is cached by netCDF
+    rng = np.random.default_rng(seed)
+    hours = rng.integers(0, 8760, num_reads)
+    cells = rng.integers(0, num_lats * num_lons, num_reads)
+
+    data = Dataset(file_name)
+    start = time.perf_counter()
+    for hour in hours:
+        data.variables['cf'][:, :, hour]
+    time_slice = (time.perf_counter() - start) / num_reads
+    data.close()
+
+    data = Dataset(file_name)
+    start = time.perf_counter()
+    for cell in cells:
+        data.variables['cf'][cell // num_lons, cell % num_lons, :]
+    cell_series = (time.perf_counter() - start) / num_reads
+    data.close()
+    return time_slice, cell_series
+
+def main(num_lats, num_lons, num_reads, complevel, output_file=None):
+    lats = 25 + 0.5 * np.arange(num_lats)
+    lons = -125 + 0.625 * np.arange(num_lons)
+    cf = get_synthetic_cf(num_lats * num_lons)
+
+    results = []
+    work_directory = tempfile.mkdtemp(prefix='powgen_layout_') + os.sep
+    try:
+        for layout in ['default', 'time', 'cell']:
+            for quantize in [False, True]:
+                for level in sorted(set([0, complevel])):
+                    destination = work_directory + '%s_%d_%d' % (layout, quantize, level) + os.sep
+                    os.mkdir(destination)
+                    start = time.perf_counter()
+                    write_outputs(destination, lats, lons, cf, powGen.get_chunk_shape(layout, num_lats, num_lons), level, quantize)
+                    write_seconds = time.perf_counter() - start
+
+                    file_name = powGen.get_cf_file_name(2017, 'solar', destination)
+                    time_slice, cell_series = time_reads(file_name, num_lats, num_lons, num_reads)
+                    stored = Dataset(file_name)
+                    max_error = max(np.abs(np.array(stored.variables['cf'][latitude, :, :]) - cf[latitude * num_lons:(latitude + 1) * num_lons]).max() for latitude in range(num_lats))
+                    stored.close()
+                    results.append({'layout': layout, 'quantize': quantize, 'complevel': level,
+                                    'file_mb': os.path.getsize(file_name) / 1024. ** 2,
+                                    'write_s': write_seconds / 2,
+                                    'hour_read_ms': time_slice * 1000,
+                                    'cell_read_ms': cell_series * 1000,
+                                    'max_abs_error': float(max_error)})
+                    shutil.rmtree(destination)
+    finally:
+        shutil.rmtree(work_directory)
+
+    print('grid %d x %d, %d reads of each kind' % (num_lats, num_lons, num_reads))
+    print('%-8s %-9s %-9s %9s %9s %13s %13s %14s' % ('layout', 'quantize', 'complevel', 'file MB', 'write s', 'hour read ms', 'cell read ms', 'max abs error'))
+    for result in results:
+        print('%-8s %-9s %-9d %9.1f %9.2f %13.2f %13.2f %14.2e' % (result['layout'], result['quantize'], result['complevel'], result['file_mb'],
+            result['write_s'], result['hour_read_ms'], result['cell_read_ms'], result['max_abs_error']))
+
+    if output_file is not None:
+        with open(output_file, 'w') as f:
+            json.dump({'grid': [num_lats, num_lons], 'reads': num_reads, 'results': results}, f, indent=1)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time hourly and per cell reads of the cf outputs for each storage layout')
+    parser.add_argument('--lats', type=int, default=20, help='latitudes of the synthetic grid')
+    parser.add_argument('--lons', type=int, default=30, help='longitudes of the synthetic grid')
+    parser.add_argument('--reads', type=int, default=20, help='reads of each kind per file')
+    parser.add_argument('--complevel', type=int, default=4, help='zlib level compared against no compression')
+    parser.add_argument('--output', default=None, help='json file the results are written to')
+    args = parser.parse_args()
+
+    main(args.lats, args.lons, args.reads, args.complevel, args.output)
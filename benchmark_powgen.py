@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#offline throughput benchmark of the powGen_impl_beta stages, runs anywhere without the MERRA data on scratch
+#writes a synthetic processed MERRA file in the same (cell, day, hour) vector layout get_data reads, times each stage on a sample of
+#its cells and reports cells/hour per stage, the results are also written as json so runs of different commits can be compared
+#usage: python benchmark_powgen.py [--lats N] [--lons N] [--cells N] [--year YEAR] [--seed N] [--output results.json]
+
+import numpy as np
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import subprocess
+from netCDF4 import Dataset
+import powGen_impl_beta as powGen
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def create_synthetic_merra(file_name, num_lats, num_lons, start_lat=35.0, start_lon=-110.0, num_days=365, seed=0):
+    """ Writes a processed MERRA file with plausible hourly weather for a num_lats x num_lons grid at MERRA spacing
+
+    ...
+
+    Args:
+    ----------
+    `file_name` (str): netcdf to write
+
+    `num_lats`, `num_lons` (int): size of the grid, cell = latitude * num_lons + longitude
+
+    `start_lat`, `start_lon` (float): south west corner of the grid in degrees
+
+    `num_days` (int): days of hourly data (leap days are skipped like the real files)
+
+    `seed` (int): seed of the random weather, the same arguments always give the same file
+
+    """
+    rng = np.random.default_rng(seed)
+    lats = start_lat + 0.5 * np.arange(num_lats)
+    lons = start_lon + 0.625 * np.arange(num_lons)
+    cell_lats = np.repeat(lats, num_lons)[:, None, None]
+    cell_lons = np.tile(lons, num_lats)[:, None, None]
+    day = np.arange(1, num_days + 1)[None, :, None]
+    hour = np.arange(24)[None, None, :]
+
+    # clear sky ghi from the sun's elevation (UTC hours), dimmed by random daily cloudiness
+    declination = np.radians(23.45) * np.sin(2 * np.pi * (284 + day) / 365)
+    hour_angle = np.radians(15 * (hour + 0.5 + cell_lons / 15 - 12))
+    cos_zenith = np.sin(np.radians(cell_lats)) * np.sin(declination) + np.cos(np.radians(cell_lats)) * np.cos(declination) * np.cos(hour_angle)
+    clearness = rng.uniform(0.3, 1.0, (num_lats * num_lons, num_days, 1))
+    ghi = 1000 * np.clip(cos_zenith, 0, None) ** 1.2 * clearness
+
+    shape = (num_lats * num_lons, num_days, 24)
+    seasonal = -10 * np.cos(2 * np.pi * day / 365)
+    variables = {'SWGDN': ghi,
+                 'T2M': 285 + seasonal + 5 * np.cos(hour_angle) + rng.normal(0, 2, shape),
+                 'PS': 90000 + rng.normal(0, 500, shape)}
+    for height, scale in [('2M', 3.), ('10M', 4.5), ('50M', 6.)]:
+        variables['U' + height] = rng.normal(1, scale, shape)
+        variables['V' + height] = rng.normal(0, scale, shape)
+
+    data = Dataset(file_name, 'w')
+    data.createDimension('lat', num_lats)
+    data.createDimension('lon', num_lons)
+    data.createDimension('cell', num_lats * num_lons)
+    data.createDimension('day', num_days)
+    data.createDimension('hour', 24)
+    data.createVariable('lat', 'f4', ('lat',))[:] = lats
+    data.createVariable('lon', 'f4', ('lon',))[:] = lons
+    for variable in powGen.MERRA_VARIABLES:
+        data.createVariable(variable, 'f4', ('cell', 'day', 'hour'))[:] = np.broadcast_to(variables[variable], shape)
+    data.close()
+    return file_name
+
+def get_commit():
+    # commit of the benchmarked tree so results can be lined up across commits
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIRECTORY, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StageTimer:
+    # total seconds and cells of every stage, in the order the stages first ran
+    def __init__(self):
+        self.seconds = dict()
+        self.cells = dict()
+
+    def time(self, stage, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.seconds[stage] = self.seconds.get(stage, 0.) + time.perf_counter() - start
+        self.cells[stage] = self.cells.get(stage, 0) + 1
+        return result
+
+    def results(self):
+        return [{'stage': stage,
+                 'cells': self.cells[stage],
+                 'seconds_per_cell': self.seconds[stage] / self.cells[stage],
+                 'cells_per_hour': 3600. * self.cells[stage] / self.seconds[stage]} for stage in self.seconds]
+
+def write_resource_files(year, latitude, longitude, dni, dhi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection):
+    # the csv and srw files simulate_cell writes for SAM
+    solar_csv = powGen.create_csv(year, latitude, longitude)
+    for jd in range(int(dni.size / 24)):
+        month, day = powGen.get_date(jd + 1)
+        hours = slice(jd * 24, (jd + 1) * 24)
+        powGen.write_day2csv(solar_csv, year, month, day, dni[hours], dhi[hours], windSpeed2[hours], temperature[hours])
+    wind_srw = powGen.create_srw(year, latitude, longitude)
+    powGen.write_2srw(wind_srw, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection)
+    return solar_csv, wind_srw
+
+def get_dni_dhi_year(year, latitude, longitude, ghi):
+    # the per day DISC decomposition for one cell's year
+    dni = np.zeros(ghi.size)
+    dhi = np.zeros(ghi.size)
+    for jd in range(int(ghi.size / 24)):
+        month, day = powGen.get_date(jd + 1)
+        hours = slice(jd * 24, (jd + 1) * 24)
+        dni[hours], dhi[hours] = powGen.get_dni_dhi(year, jd + 1, month, day, latitude, longitude, ghi[hours])
+    return dni, dhi
+
+def run_stages(year, processed_merra_file, cells, power_curve, work_directory):
+    lat, lon = powGen.get_lat_lon(processed_merra_file)
+    merra_data = Dataset(processed_merra_file)
+    powGen.create_netCDF_files(year, lat, lon, work_directory)
+    timer = StageTimer()
+
+    for cell in cells:
+        latitude, longitude = divmod(int(cell), lon.size)
+        ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = timer.time('get_data', powGen.get_data, latitude, longitude, lon.size, merra_data)
+        dni, dhi = timer.time('get_dni_dhi', get_dni_dhi_year, year, lat[latitude], lon[longitude], ghi)
+        timer.time('get_dni_dhi_batch', powGen.get_dni_dhi_batch, year, lat[latitude:latitude + 1], lon[longitude:longitude + 1], ghi[None, :])
+        solar_csv, wind_srw = timer.time('write_resource', write_resource_files, year, lat[latitude], lon[longitude], dni, dhi,
+            temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection)
+        solar_outputs = timer.time('run_solar', powGen.run_solar, solar_csv, lat[latitude])
+        wind_outputs = timer.time('run_wp', powGen.run_wp, wind_srw, 1, power_curve)
+        timer.time('write_cord', powGen.write_cord, year, solar_outputs, wind_outputs, latitude, longitude, work_directory)
+        os.remove(solar_csv)
+        os.remove(wind_srw)
+
+    merra_data.close()
+    return timer.results()
+
+def main(num_lats, num_lons, num_cells, year, output_file=None, seed=0):
+    power_curve = powGen.get_power_curve(os.path.join(REPO_DIRECTORY, 'wind_turbine_power_curves.xlsx'))
+
+    # resource files are written to the working directory, so everything runs in a scratch folder that is removed afterwards
+    work_directory = tempfile.mkdtemp(prefix='powgen_benchmark_') + os.sep
+    current_directory = os.getcwd()
+    os.chdir(work_directory)
+    try:
+        start = time.perf_counter()
+        processed_merra_file = create_synthetic_merra(work_directory + 'processedMERRAbenchmark' + str(year) + '.nc', num_lats, num_lons, seed=seed)
+        generation_seconds = time.perf_counter() - start
+
+        num_grid_cells = num_lats * num_lons
+        cells = np.unique(np.linspace(0, num_grid_cells - 1, min(num_cells, num_grid_cells)).astype(int))
+        stages = run_stages(year, processed_merra_file, cells, power_curve, work_directory)
+    finally:
+        os.chdir(current_directory)
+        shutil.rmtree(work_directory)
+
+    results = {'commit': get_commit(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'host': platform.node(),
+               'grid': [num_lats, num_lons],
+               'cells': int(cells.size),
+               'year': year,
+               'synthetic_data_seconds': generation_seconds,
+               'stages': stages}
+
+    print('%-18s %12s %12s' % ('stage', 's/cell', 'cells/hour'))
+    for stage in stages:
+        print('%-18s %12.4f %12.0f' % (stage['stage'], stage['seconds_per_cell'], stage['cells_per_hour']))
+    # main decomposes ghi with get_dni_dhi_batch, the per day get_dni_dhi is timed for comparison only
+    sequential = sum(stage['seconds_per_cell'] for stage in stages if stage['stage'] != 'get_dni_dhi')
+    results['main_cells_per_hour'] = 3600. / sequential
+    print('%-18s %12.4f %12.0f' % ('main (file mode)', sequential, 3600. / sequential))
+
+    if output_file is not None:
+        with open(output_file, 'w') as f:
+            json.dump(results, f, indent=1)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the powGen stages on synthetic processed MERRA data')
+    parser.add_argument('--lats', type=int, default=4, help='latitudes of the synthetic grid')
+    parser.add_argument('--lons', type=int, default=4, help='longitudes of the synthetic grid')
+    parser.add_argument('--cells', type=int, default=4, help='cells of the grid run through every stage')
+    parser.add_argument('--year', type=int, default=2017)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic weather')
+    parser.add_argument('--output', default=None, help='json file the results are written to')
+    args = parser.parse_args()
+
+    main(args.lats, args.lons, args.cells, args.year, args.output, args.seed)
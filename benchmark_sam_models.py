@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#micro-benchmark of the SAM model pool in powGen_impl_beta: times building and configuring a fresh PVWatts/Windpower model for every
+#cell against reusing the preconfigured model of the process, on the resource data of one cell of a processed MERRA file
+#usage: python benchmark_sam_models.py <processed MERRA file> <year> [--repeats N] [--power-curves xlsx]
+
+import numpy as np
+import time
+import argparse
+from netCDF4 import Dataset
+import powGen_impl_beta as powGen
+
+def time_runs(run, repeats):
+    # seconds per call, best of the repeats so background load does not count
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def run_fresh_solar(solar_resource, latitude):
+    # how run_solar worked before the pool, a new model for every cell
+    s = powGen.create_solar_model()
+    s.SolarResource.solar_resource_data = solar_resource
+    s.SystemDesign.tilt = abs(latitude)
+    s.execute()
+    return np.array(s.Outputs.ac)
+
+def run_fresh_wp(wind_resource, wind_class, power_curve):
+    d = powGen.create_wind_model()
+    d.Resource.wind_resource_data = wind_resource
+    speed, powerout = powGen.get_turbine_curve(wind_class, power_curve)
+    d.Turbine.wind_turbine_powercurve_powerout = powerout
+    d.Turbine.wind_turbine_powercurve_windspeeds = speed
+    d.execute()
+    return np.array(d.Outputs.gen)
+
+def main(processed_merra_file, year, repeats, power_curve_file):
+    lat, lon = powGen.get_lat_lon(processed_merra_file)
+    power_curve = powGen.get_power_curve(power_curve_file)
+
+    # resources of the first cell, passed in memory so file writing does not hide the construction cost
+    merra_data = Dataset(processed_merra_file)
+    ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = powGen.get_tile_data(merra_data, 0, 1)
+    merra_data.close()
+    dni, dhi = powGen.get_dni_dhi_batch(year, lat[:1], lon[:1], ghi)
+    solar_resource = powGen.get_solar_resource_data(year, lat[0], lon[0], dni[0], dhi[0], windSpeed2[0], temperature[0])
+    wind_resource = powGen.get_wind_resource_data(year, lat[0], lon[0], temperature[0], pressure[0], windSpeed2[0], windSpeed10[0], windSpeed50[0], windDirection[0])
+
+    results = [
+        ('solar', 'construct', time_runs(powGen.create_solar_model, repeats)),
+        ('solar', 'fresh model per cell', time_runs(lambda: run_fresh_solar(solar_resource, lat[0]), repeats)),
+        ('solar', 'pooled model', time_runs(lambda: powGen.run_solar(solar_resource, lat[0]), repeats)),
+        ('wind', 'construct', time_runs(powGen.create_wind_model, repeats)),
+        ('wind', 'fresh model per cell', time_runs(lambda: run_fresh_wp(wind_resource, 1, power_curve), repeats)),
+        ('wind', 'pooled model', time_runs(lambda: powGen.run_wp(wind_resource, 1, power_curve), repeats)),
+    ]
+    for technology, case, seconds in results:
+        print('%-6s %-22s %9.3f ms' % (technology, case, seconds * 1000))
+    for technology in ['solar', 'wind']:
+        fresh, pooled = [seconds for tech, case, seconds in results if tech == technology and case != 'construct']
+        print('%s: pool saves %.3f ms per cell (%.1f%%)' % (technology, (fresh - pooled) * 1000, 100 * (fresh - pooled) / fresh))
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time fresh SAM models per cell against the reused model pool')
+    parser.add_argument('processed_merra_file')
+    parser.add_argument('year', type=int)
+    parser.add_argument('--repeats', type=int, default=20, help='runs of each case, the fastest is reported')
+    parser.add_argument('--power-curves', default='wind_turbine_power_curves.xlsx', help='turbine power curve workbook')
+    args = parser.parse_args()
+
+    main(args.processed_merra_file, args.year, args.repeats, args.power_curves)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#times the startup of the powGen entry points in fresh interpreters: importing powGen_impl_beta (what pool workers and the
+#other scripts do) and running powGen.py and powGen_impl_beta.py up to argument parsing (--help), which every job array task pays
+#before its first cell. Also lists which heavy libraries each one loaded, the results are written as json so commits can be compared
+#usage: python benchmark_startup.py [--repeats N] [--output results.json]
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+REPO_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# libraries that take a noticeable share of startup, reported when an entry point loaded them
+HEAVY_MODULES = ['PySAM', 'pvlib', 'pandas', 'scipy', 'matplotlib', 'seaborn']
+
+# python code run in a fresh interpreter for each entry point, the script ones stop at --help like a task stops at its first cell
+ENTRY_POINTS = {'python': 'pass',
+                'import powGen_impl_beta': 'import powGen_impl_beta',
+                'powGen_impl_beta.py --help': "import sys, runpy; sys.argv = ['powGen_impl_beta.py', '--help']\ntry: runpy.run_path('powGen_impl_beta.py', run_name='__main__')\nexcept SystemExit: pass",
+                'powGen.py --help': "import sys, runpy; sys.argv = ['powGen.py', '--help']\ntry: runpy.run_path('powGen.py', run_name='__main__')\nexcept SystemExit: pass"}
+
+def get_commit():
+    # commit of the benchmarked tree so results can be lined up across commits
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIRECTORY, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def time_entry_point(code, repeats):
+    # wall time of each fresh interpreter running code, and the heavy modules it had loaded at the end
+    report = "\nimport sys, json\nprint(json.dumps([name for name in %r if name in sys.modules]))" % HEAVY_MODULES
+    seconds = []
+    loaded = None
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code + report], cwd=REPO_DIRECTORY, capture_output=True, text=True, check=True).stdout
+        seconds.append(time.perf_counter() - start)
+        loaded = json.loads(output.strip().splitlines()[-1])
+    return seconds, loaded
+
+def main(repeats, output_file=None):
+    results = []
+    for name, code in ENTRY_POINTS.items():
+        # a first untimed run warms the file system cache, like every task after the first on a node
+        time_entry_point(code, 1)
+        seconds, loaded = time_entry_point(code, repeats)
+        results.append({'entry_point': name, 'median_s': statistics.median(seconds), 'min_s': min(seconds), 'max_s': max(seconds), 'loaded': loaded})
+
+    print('%d fresh interpreters per entry point' % repeats)
+    print('%-28s %9s %9s %9s  %s' % ('entry point', 'median s', 'min s', 'max s', 'heavy modules loaded'))
+    for result in results:
+        print('%-28s %9.3f %9.3f %9.3f  %s' % (result['entry_point'], result['median_s'], result['min_s'], result['max_s'], ', '.join(result['loaded']) or '-'))
+
+    if output_file is not None:
+        with open(output_file, 'w') as f:
+            json.dump({'commit': get_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(), 'host': platform.node(),
+                       'repeats': repeats, 'results': results}, f, indent=1)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time the startup of the powGen entry points')
+    parser.add_argument('--repeats', type=int, default=5, help='fresh interpreters timed per entry point')
+    parser.add_argument('--output', default=None, help='json file the results are written to')
+    args = parser.parse_args()
+
+    main(args.repeats, args.output)
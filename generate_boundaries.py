@@ -13,7 +13,37 @@ import matplotlib.pyplot as plt
 import seaborn as sns; sns.set()
 import os
 
-def generateBounds(regionFilename, latitudeRange, longitudeRange):
+def getNearestIndices(rasterAxis, values):
+    """ Finds the index of the closest raster coordinate to each value with a binary search of the sorted raster axis
+        (on a tie the lower raster index is used, like the first match of a full scan)
+
+    ...
+
+    Args:
+    ----------
+    `rasterAxis` (np array): latitudes or longitudes of the raster, in any order
+
+    `values` (np array): MERRA latitudes or longitudes to be located in the raster
+
+    Returns:
+    ----------
+    `nearestIndices` (np array): index into `rasterAxis` of the closest coordinate to each value
+    """
+    if len(rasterAxis) == 1:
+        return np.zeros(len(values), dtype=int)
+    order = np.argsort(rasterAxis, kind="stable")
+    sortedAxis = rasterAxis[order]
+
+    #candidates are the raster coordinates directly below and above each value
+    upper = np.clip(np.searchsorted(sortedAxis, values), 1, len(sortedAxis) - 1)
+    lower = upper - 1
+    lowerDistance = np.abs(sortedAxis[lower] - values)
+    upperDistance = np.abs(sortedAxis[upper] - values)
+
+    useLower = (lowerDistance < upperDistance) | ((lowerDistance == upperDistance) & (order[lower] < order[upper]))
+    return np.where(useLower, order[lower], order[upper])
+
+def generateBounds(regionFilename, latitudeRange, longitudeRange, indexCache=None):
     """ Generates map of points in MERRA data that are in desired region or outside bounds for mapping to correct wind turbine classes
         (it is assumed that the dataset is in a rectangular shape)
 
@@ -27,6 +57,8 @@ def generateBounds(regionFilename, latitudeRange, longitudeRange):
 
     `longitudeRange` (np array): contains range of specific longitudes for region of area of interest
 
+    `indexCache` (dict): optional, raster indices of the MERRA grid already found for other files, reused when a file has the same raster axes
+
 
     """   
     rastData =  Dataset(regionFilename)
@@ -35,21 +67,18 @@ def generateBounds(regionFilename, latitudeRange, longitudeRange):
     latsRast =  np.array(rastData["lat"][:])
     lonsRast =  np.array(rastData["lon"][:])
     regionOfInterest = np.array(rastData["Band1"][:][:])
+    rastData.close()
 
+    #closest raster row and column of every MERRA latitude and longitude, only searched once for each distinct raster grid
+    if indexCache is None:
+        indexCache = {}
+    key = (latsRast.tobytes(), lonsRast.tobytes())
+    if key not in indexCache:
+        indexCache[key] = (getNearestIndices(latsRast, latitudeRange), getNearestIndices(lonsRast, longitudeRange))
+    closestLatIndices, closestLonIndices = indexCache[key]
 
-    regionArray = np.zeros((len(longitudeRange),len(latitudeRange)))
-
-
-    for lat in latitudeRange:
-        closestLatIndex = np.where( np.abs(latsRast-lat) == np.abs(latsRast-lat).min())[0][0]
-        for lon in longitudeRange:
-            closestLonIndex = np.where( np.abs(lonsRast-lon) == np.abs(lonsRast-lon).min())[0][0]
-
-            #If lat long of MERRA data box is offshore or in region (values 1 in raster) set them equal to 1 for master Array, else they are left as zeros
-            if (regionOfInterest[closestLatIndex][closestLonIndex] == 1):
-                latIndex = np.where(latitudeRange == lat)[0][0]
-                lonIndex = np.where(longitudeRange == lon)[0][0]
-                regionArray[lonIndex][latIndex] = 1
+    #If lat long of MERRA data box is offshore or in region (values 1 in raster) set them equal to 1 for master Array, else they are left as zeros
+    regionArray = (regionOfInterest[np.ix_(closestLatIndices, closestLonIndices)] == 1).T.astype(float)
 
 
     #for debugging
@@ -91,9 +120,10 @@ def main(minLon, maxLon,minLat, maxLat, implementStateBounds = False):
     regionArray = np.zeros((len(longitudeRange),len(latitudeRange)))
     if implementStateBounds:
         stateFiles = os.listdir( os.path.abspath("stateNetcdfs"))
-        #go state by state building up region array
+        #go state by state building up region array, states on the same raster grid share one nearest neighbour search
+        indexCache = {}
         for stateFile in stateFiles:
-            regionArray += generateBounds("stateNetcdfs\\" + stateFile,latitudeRange,longitudeRange)
+            regionArray += generateBounds("stateNetcdfs\\" + stateFile,latitudeRange,longitudeRange,indexCache)
     else:
         regionFilename = "offshoreBoundaries.nc"
         regionArray = generateBounds(regionFilename,latitudeRange,longitudeRange)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#builds the processed MERRA file of a year straight from the raw daily RAD and SLV downloads, streaming one day at a time
+#the variables powGen needs are written in the vector (cell, day, hour) layout get_data reads, cell = latitude * num_lons + longitude,
+#leap days are skipped like the rest of powGen. Only a block of days is held in memory instead of the whole year.
+#usage: python ingest_merra.py <year> <region> [--days-per-block N]
+
+import numpy as np
+import os
+import glob
+import datetime
+import argparse
+from netCDF4 import Dataset
+from powGen_impl_beta import get_processed_merra_file
+
+# variables powGen reads from each of the two MERRA-2 collections
+RAW_VARIABLES = {'rad': ['SWGDN'],
+                 'slv': ['U2M', 'V2M', 'U10M', 'V10M', 'U50M', 'V50M', 'T2M', 'PS']}
+
+def get_raw_merra_path(root_directory, region):
+    return root_directory + 'merraData/resource/' + region + '/raw/'
+
+def get_dates(year):
+    # every day of the year except february 29th
+    dates = []
+    date = datetime.date(year, 1, 1)
+    while date.year == year:
+        if not (date.month == 2 and date.day == 29):
+            dates.append(date)
+        date += datetime.timedelta(days=1)
+    return dates
+
+def get_raw_merra_files(raw_merra_path, year):
+    """ Finds the raw daily files of both collections for every day of the year
+
+    ...
+
+    Args:
+    ----------
+    `raw_merra_path` (str): folder the MERRA-2 tavg1_2d_rad_Nx and tavg1_2d_slv_Nx files were downloaded to
+
+    `year` (int): year to ingest
+
+    Returns:
+    ----------
+    `raw_files` (list): (date, {'rad': file, 'slv': file}) for each day, in order
+    """
+    raw_files = []
+    missing = []
+    for date in get_dates(year):
+        day_files = dict()
+        for collection in RAW_VARIABLES:
+            # e.g. MERRA2_400.tavg1_2d_slv_Nx.20170101.nc4 or MERRA2_400.tavg1_2d_slv_Nx.20170101.SUB.nc
+            matches = sorted(glob.glob(raw_merra_path + '*tavg1_2d_%s_Nx.%s*.nc*' % (collection, date.strftime('%Y%m%d'))))
+            if len(matches) == 0:
+                missing.append(collection + ' ' + date.isoformat())
+            else:
+                day_files[collection] = matches[0]
+        raw_files.append((date, day_files))
+    if len(missing) > 0:
+        raise FileNotFoundError('%d raw MERRA files missing in %s: %s' % (len(missing), raw_merra_path, ', '.join(missing[:10]) + (', ...' if len(missing) > 10 else '')))
+    return raw_files
+
+def read_day(day_files, lats, lons):
+    # hourly values of one day as (cell, hour) arrays
+    day = dict()
+    for collection, file_name in day_files.items():
+        raw_data = Dataset(file_name)
+        try:
+            if not (np.array_equal(np.array(raw_data.variables['lat'][:]), lats) and np.array_equal(np.array(raw_data.variables['lon'][:]), lons)):
+                raise ValueError(file_name + ' is not on the same grid as the first day')
+            for variable in RAW_VARIABLES[collection]:
+                values = np.array(raw_data.variables[variable][:], dtype='f4')
+                if values.shape != (24, lats.size, lons.size):
+                    raise ValueError('%s has %s of shape %s, expected (24, %d, %d)' % (file_name, variable, values.shape, lats.size, lons.size))
+                day[variable] = values.reshape(24, lats.size * lons.size).T
+        finally:
+            raw_data.close()
+    return day
+
+def ingest_year(raw_merra_path, year, processed_merra_file, days_per_block=30, cell_chunk=256):
+    """ Writes the processed MERRA file of a year from its raw daily files
+
+    ...
+
+    Args:
+    ----------
+    `raw_merra_path` (str): folder with the raw daily files (see get_raw_merra_files)
+
+    `year` (int): year to ingest
+
+    `processed_merra_file` (str): netcdf to write, the same layout rewriteMERRA.py produced
+
+    `days_per_block` (int): days buffered in memory before they are written, also the day size of the chunks
+
+    `cell_chunk` (int): cells per chunk, tiles of powGen read whole chunks
+
+    """
+    raw_files = get_raw_merra_files(raw_merra_path, year)
+    num_days = len(raw_files)
+
+    # grid of the region from the first day, every other day must match it
+    raw_data = Dataset(raw_files[0][1]['slv'])
+    lats = np.array(raw_data.variables['lat'][:])
+    lons = np.array(raw_data.variables['lon'][:])
+    raw_data.close()
+    num_cells = lats.size * lons.size
+    days_per_block = min(days_per_block, num_days)
+
+    # written under a temporary name, an interrupted ingest never leaves a partial file behind that looks finished
+    temp_file = '%s.%d.tmp' % (processed_merra_file, os.getpid())
+    data = Dataset(temp_file, 'w')
+    data.createDimension('lat', lats.size)
+    data.createDimension('lon', lons.size)
+    data.createDimension('cell', num_cells)
+    data.createDimension('day', num_days)
+    data.createDimension('hour', 24)
+    data.createVariable('lat', 'f4', ('lat',))[:] = lats
+    data.createVariable('lon', 'f4', ('lon',))[:] = lons
+    variables = [variable for collection in RAW_VARIABLES for variable in RAW_VARIABLES[collection]]
+    for variable in variables:
+        data.createVariable(variable, 'f4', ('cell', 'day', 'hour'), chunksizes=(min(cell_chunk, num_cells), days_per_block, 24))
+
+    # a block of days is filled one raw day at a time and written as whole chunks
+    block = {variable: np.empty((num_cells, days_per_block, 24), dtype='f4') for variable in variables}
+    try:
+        for block_start in range(0, num_days, days_per_block):
+            block_stop = min(block_start + days_per_block, num_days)
+            for day_index in range(block_start, block_stop):
+                day = read_day(raw_files[day_index][1], lats, lons)
+                for variable in variables:
+                    block[variable][:, day_index - block_start, :] = day[variable]
+            for variable in variables:
+                data.variables[variable][:, block_start:block_stop, :] = block[variable][:, :block_stop - block_start, :]
+            print('Ingested %s to %s' % (raw_files[block_start][0].isoformat(), raw_files[block_stop - 1][0].isoformat()), flush=True)
+    except BaseException:
+        data.close()
+        os.remove(temp_file)
+        raise
+    data.close()
+    os.replace(temp_file, processed_merra_file)
+    return processed_merra_file
+
+def main(year, region, days_per_block=30):
+    root_directory = '/scratch/mtcraig_root/mtcraig1/shared_data/'
+    processed_merra_path = root_directory + 'merraData/resource/' + region + '/processed/'
+    return ingest_year(get_raw_merra_path(root_directory, region), year, get_processed_merra_file(processed_merra_path, region, year), days_per_block)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the processed MERRA file of a year from the raw daily downloads')
+    parser.add_argument('year', type=int)
+    parser.add_argument('region')
+    parser.add_argument('--days-per-block', type=int, default=30, help='days held in memory before they are written')
+    args = parser.parse_args()
+
+    main(args.year, args.region, args.days_per_block)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#run time instrumentation of powGen_impl_beta: seconds spent in each stage (read, decompose, resource, solar, wind, write),
+#peak memory, json-lines metrics and a periodic summary with cells/hour and the time left to the end of the grid
+
+import os
+import sys
+import json
+import time
+import datetime
+import contextlib
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak memory is then not reported
+    resource = None
+
+# seconds spent in each stage by this process since the last pop_stage_times
+stage_times = dict()
+
+@contextlib.contextmanager
+def stage(name, times=None):
+    # adds the time spent inside the with block to stage `name` (of this process unless a dict is given)
+    times = stage_times if times is None else times
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times[name] = times.get(name, 0.) + time.perf_counter() - start
+
+def get_peak_memory_mb():
+    # largest resident set size of this process so far
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak / 1024. ** 2 if sys.platform == 'darwin' else peak / 1024.
+
+def pop_stage_times():
+    # stage times of this process since the last call, sent back with each tile by pool workers
+    times = dict(stage_times)
+    stage_times.clear()
+    return {'pid': os.getpid(), 'stages': times, 'peak_memory_mb': get_peak_memory_mb()}
+
+class MetricsLog:
+    """ Collects the stage times of finished tiles, writes them as json lines and prints a summary every summary_interval seconds
+
+    ...
+
+    Args:
+    ----------
+    `total_cells` (int): cells this run simulates, used for the ETA
+
+    `metrics_file` (str): json-lines file the tile and summary records are appended to (None only prints the summaries)
+
+    `summary_interval` (float): seconds between printed summaries
+
+    `run_info` (dict): written once at the start of the metrics file (year, region, settings of the run)
+
+    """
+
+    def __init__(self, total_cells, metrics_file=None, summary_interval=60., run_info=None):
+        self.total_cells = total_cells
+        self.summary_interval = summary_interval
+        self.start = time.time()
+        self.last_summary = self.start
+        self.cells = 0
+        self.stages = dict()
+        self.peak_memory_mb = dict()
+        self.file = open(metrics_file, 'a') if metrics_file is not None else None
+        self.write({'event': 'start', 'total_cells': total_cells, 'run': run_info or {}})
+
+    def write(self, record):
+        if self.file is not None:
+            record['time'] = time.time()
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def add_tile(self, tile_start, tile_stop, tile_metrics):
+        # tile_metrics is pop_stage_times of the process that simulated the tile, with the write stage added by main
+        num_cells = tile_stop - tile_start
+        self.cells += num_cells
+        for name, seconds in tile_metrics['stages'].items():
+            self.stages[name] = self.stages.get(name, 0.) + seconds
+        self.peak_memory_mb[tile_metrics['pid']] = tile_metrics['peak_memory_mb']
+        self.write({'event': 'tile', 'tile': [tile_start, tile_stop], 'cells': num_cells, 'pid': tile_metrics['pid'],
+                    'stages': tile_metrics['stages'], 'peak_memory_mb': tile_metrics['peak_memory_mb']})
+        if time.time() - self.last_summary >= self.summary_interval:
+            self.summary()
+
+    def get_summary(self):
+        # peak memory is the largest of this process (the writer) and every process that returned a tile
+        self.peak_memory_mb[os.getpid()] = get_peak_memory_mb()
+        elapsed = time.time() - self.start
+        cells_per_hour = 3600. * self.cells / elapsed if self.cells > 0 else 0.
+        eta = (self.total_cells - self.cells) / cells_per_hour * 3600. if cells_per_hour > 0 else None
+        peaks = [peak for peak in self.peak_memory_mb.values() if peak is not None]
+        return {'event': 'summary',
+                'cells': self.cells,
+                'total_cells': self.total_cells,
+                'elapsed_s': elapsed,
+                'cells_per_hour': cells_per_hour,
+                'eta_s': eta,
+                'stages': dict(self.stages),
+                'peak_memory_mb': max(peaks) if len(peaks) > 0 else None}
+
+    def summary(self):
+        summary = self.get_summary()
+        self.last_summary = time.time()
+        self.write(summary)
+
+        # stage shares are of the summed stage time, with workers this adds up to more than the wall time
+        total = sum(summary['stages'].values())
+        shares = ', '.join('%s %.0f%%' % (name, 100. * seconds / total) for name, seconds in summary['stages'].items()) if total > 0 else ''
+        eta = str(datetime.timedelta(seconds=int(summary['eta_s']))) if summary['eta_s'] is not None else '?'
+        memory = '%.0f MB' % summary['peak_memory_mb'] if summary['peak_memory_mb'] is not None else '?'
+        print('{:%Y-%m-%d %H:%M:%S}'.format(datetime.datetime.now()) + ' \t %d/%d cells, %.0f cells/hour, ETA %s, peak memory %s (%s)'
+            % (summary['cells'], summary['total_cells'], summary['cells_per_hour'], eta, memory, shares), flush=True)
+        return summary
+
+    def close(self):
+        summary = self.summary()
+        if self.file is not None:
+            self.file.close()
+        return summary
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#threads and bounded queues of the pipelined mode of powGen_impl_beta (--pipeline): a reader thread prefetches the resource of the
+#next tiles and a writer thread writes finished tiles, so netcdf reads and writes on scratch overlap the simulation in the main thread
+
+import queue
+import threading
+
+# netcdf-c is not thread safe, every netcdf call made while pipeline threads may run holds this lock
+netcdf_lock = threading.Lock()
+
+# put on a queue after its last item
+DONE = None
+
+class Pipeline:
+    """ Threads connected by bounded queues, the first exception raised in any of them stops the others and is re-raised by join
+
+    ...
+
+    Args:
+    ----------
+    `poll_interval` (float): seconds a blocked put or get waits before checking whether the pipeline was stopped
+
+    """
+
+    def __init__(self, poll_interval=0.1):
+        self.poll_interval = poll_interval
+        self.stop = threading.Event()
+        self.errors = []
+        self.threads = []
+
+    def start(self, function, *args):
+        thread = threading.Thread(target=self.run, args=(function,) + args, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def run(self, function, *args):
+        try:
+            function(*args)
+        except BaseException as error:
+            self.errors.append(error)
+            self.stop.set()
+
+    def put(self, item_queue, item):
+        # blocks while the queue is full, False once the pipeline was stopped
+        while not self.stop.is_set():
+            try:
+                item_queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def get(self, item_queue):
+        # next item of the queue, DONE once the pipeline was stopped
+        while not self.stop.is_set():
+            try:
+                return item_queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+        return DONE
+
+    def join(self, error=None):
+        # error is an exception of the main thread, the other threads are stopped and it is left to the caller to re-raise
+        if error is not None:
+            self.stop.set()
+        for thread in self.threads:
+            thread.join()
+        if error is None and len(self.errors) > 0:
+            raise self.errors[0]
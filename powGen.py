@@ -1,22 +1,45 @@
 import sys
 import os
+import argparse
+import subprocess
 import numpy as np
+import powGen_impl_beta
 from powGen_impl_beta import get_lat_lon
-import wind_class_generation
+import ingest_merra
 import time
 from netCDF4 import Dataset 
 
-region=sys.argv[1]
-start_year=int(sys.argv[2])
-end_year=int(sys.argv[3])
+parser = argparse.ArgumentParser()
+parser.add_argument('region')
+parser.add_argument('start_year', type=int)
+parser.add_argument('end_year', type=int)
+parser.add_argument('--shards', type=int, default=1, help='split each region-year into this many spatial shards, run as a slurm job array')
+parser.add_argument('--local', action='store_true', help='run the shards and the merge one after another in this process instead of submitting slurm jobs')
+parser.add_argument('--ingest', action='store_true', help='build missing processed MERRA files from the raw daily downloads in the region\'s raw/ folder first')
+parser.add_argument('--batch-years', action='store_true', help='simulate all years in one job (one process) instead of one job per year')
+args = parser.parse_args()
+
+region=args.region
+start_year=args.start_year
+end_year=args.end_year
+num_shards=args.shards
 
 #error handling
 if start_year > end_year:
      print('Invalid start/end year')
      sys.exit(1)
 
-# create IEC turbine class spreasheet if necessary:
 root_directory = '/scratch/mtcraig_root/mtcraig1/shared_data/'
+
+# stream the raw daily files of years without a processed file into one (replaces running rewriteMERRA.py by hand)
+if args.ingest:
+     processed_merra_path = root_directory + 'merraData/resource/' + region + '/processed/'
+     for year in range(start_year, end_year + 1):
+          if not os.path.exists(powGen_impl_beta.get_processed_merra_file(processed_merra_path, region, year)):
+               print('Ingesting raw MERRA files of', year)
+               ingest_merra.main(year, region)
+
+# create IEC turbine class spreasheet if necessary:
 excelFilePath = root_directory + 'powGen/IEC_wind_class_'+region+'.xlsx'
 
 # check for existing spreadsheet
@@ -44,13 +67,43 @@ else:
      rawDataFilePath = processed_merra_file
 
      #generates wind power class map based on IEC wind power classes, returns file path to which power class was written to
+     #(imported here, only the first run of a region needs it)
+     import wind_class_generation
      wind_class_generation.main(np.sort(yearList), latLength, longLength, excelFilePath, rawDataFilePath)
 
+if num_shards < 1:
+     print('Invalid number of shards')
+     sys.exit(1)
+
+# with --batch-years every job covers the whole range of years, otherwise there is a job (or job array) per year
+if args.batch_years:
+     year_ranges = [(start_year, end_year)]
+else:
+     year_ranges = [(year, year) for year in range(start_year, end_year + 1)]
+
+if args.local:
+     for first_year, last_year in year_ranges:
+          print("Running locally:", first_year, last_year, region)
+          if num_shards == 1:
+               powGen_impl_beta.main(first_year, region, end_year=last_year)
+          else:
+               for shard_index in range(num_shards):
+                    powGen_impl_beta.main(first_year, region, num_shards=num_shards, shard_index=shard_index, end_year=last_year)
+               powGen_impl_beta.main(first_year, region, num_shards=num_shards, merge=True, end_year=last_year)
+     sys.exit(0)
+
 print('Submitting batch jobs')
-year = start_year
-while year <= end_year:
-     print("Running:", year, region)
-     os.system('sbatch powGen.sbat '+str(year)+' '+region)
-     year += 1
+for first_year, last_year in year_ranges:
+     print("Running:", first_year, last_year, region)
+     end_year_option = ['--end-year', str(last_year)] if last_year != first_year else []
+     if num_shards == 1:
+          os.system(' '.join(['sbatch', 'powGen.sbat', str(first_year), region] + end_year_option))
+     else:
+          # one array task per shard, then a merge job that only starts once every task succeeded
+          array_job = subprocess.run(['sbatch', '--parsable', '--array=0-'+str(num_shards-1), 'powGen.sbat', str(first_year), region, '--shards', str(num_shards)] + end_year_option,
+               capture_output=True, text=True, check=True)
+          array_job_id = array_job.stdout.strip().split(';')[0]
+          print("Submitted job array", array_job_id, "with", num_shards, "shards")
+          os.system(' '.join(['sbatch', '--dependency=afterok:'+array_job_id, 'powGen.sbat', str(first_year), region, '--shards', str(num_shards), '--merge'] + end_year_option))
 
 os.system('rm -r __pycache__/')
\ No newline at end of file
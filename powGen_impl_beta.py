@@ -2,24 +2,79 @@
 # coding: utf-8
 
 import numpy as np
-import os, sys, datetime
-from netCDF4 import Dataset
+import os, sys, datetime, time
+import argparse
+import multiprocessing
+import queue
+import shutil
+import signal
+import threading
+import tempfile
+from netCDF4 import Dataset, default_fillvals
 import csv
 import math
-import PySAM.Pvwattsv7 as pv
-import pandas as pd
-import pvlib
-import PySAM.Windpower as wp
 import os.path
 from os import path
-import wind_class_generation
+import asset_cache
+import metrics
+import pipeline
+import result_cache
+# PySAM, pvlib, pandas and pvwatts_engine are imported by the functions that use them, so tasks that never simulate
+# (job submission, merges, --help) don't pay for loading them
 
 #SYSTEM INPUTS
 if __name__ == "__main__":
-    year = int(sys.argv[1])
-    region = sys.argv[2]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('year', type=int)
+    parser.add_argument('region')
+    parser.add_argument('--end-year', type=int, default=None, help='simulate every year from year to END_YEAR in this process, reusing static inputs and workers')
+    parser.add_argument('--in-memory', action='store_true', help='pass resource data to SAM directly instead of writing csv/srw files')
+    parser.add_argument('--tile-size', type=int, default=256, help='number of cells read from the processed MERRA file at once')
+    parser.add_argument('--chunk-shape', type=int, nargs=3, default=None, metavar=('LAT', 'LON', 'HOUR'), help='chunk sizes of the cf output variables')
+    parser.add_argument('--complevel', type=int, default=0, help='zlib compression level of the cf output variables (0 is off)')
+    parser.add_argument('--layout', choices=['default', 'time', 'cell'], default='default', help='chunk the cf outputs for reading hours across the region (time) or years of single cells (cell)')
+    parser.add_argument('--quantize', action='store_true', help='store cf as 16 bit integers with a scale factor of 1e-4')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes simulating tiles in parallel')
+    parser.add_argument('--pipeline', action='store_true', help='read the next tiles and write finished tiles in threads while tiles are simulated')
+    parser.add_argument('--queue-depths', type=int, nargs=2, default=[2, 2], metavar=('READ', 'WRITE'), help='with --pipeline, tiles read ahead and simulated tiles waiting to be written')
+    parser.add_argument('--shared-resource', action='store_true', help='with --workers, read the region\'s resource once into shared memory that every worker maps')
+    parser.add_argument('--shared-directory', default=None, help='folder of the --shared-resource arrays (/dev/shm where available)')
+    parser.add_argument('--technologies', choices=['solar', 'wind'], nargs='+', default=['solar', 'wind'], help='technologies to simulate, the output files of the others are left as they are')
+    parser.add_argument('--result-cache', nargs='?', const='', default=None, metavar='DIRECTORY', help='reuse the results of cells whose inputs did not change since an earlier run (cache in the region\'s cfs folder unless a directory is given)')
+    parser.add_argument('--resume', action='store_true', help='keep existing output files and only simulate cells not yet fully written')
+    parser.add_argument('--shards', type=int, default=1, help='number of spatial shards the region is split into for a job array')
+    parser.add_argument('--shard-index', type=int, default=None, help='shard simulated by this task, written to partial output files')
+    parser.add_argument('--merge', action='store_true', help='assemble the partial outputs of all shards into the final files')
+    parser.add_argument('--solar-engine', choices=['sam', 'numpy'], default='sam', help='simulate solar with SAM cell by cell or with the vectorized numpy engine')
+    parser.add_argument('--wind-engine', choices=['sam', 'numpy'], default='sam', help='simulate wind with SAM cell by cell or with the vectorized numpy engine')
+    parser.add_argument('--cell-range', type=int, nargs=2, default=None, metavar=('START', 'STOP'), help='only simulate cells START:STOP of the processed vector (written to the cell_range/ folder of the region), e.g. to profile one cell or tile')
+    parser.add_argument('--metrics', default=None, help='json-lines file stage times, peak memory and progress summaries are appended to')
+    parser.add_argument('--no-geometry-cache', action='store_true', help='compute the sun position of every tile instead of reading the region\'s solar geometry table')
+    parser.add_argument('--sparse', action='store_true', help='only simulate the cells and technologies that are needed, the rest is written as fill values')
+    parser.add_argument('--region-mask', default=None, help='with --sparse, MERRA format bounds spreadsheet of the region (cells with 0 are skipped)')
+    parser.add_argument('--offshore-mask', default=None, help='with --sparse, MERRA format offshore bounds spreadsheet (no solar offshore)')
+    parser.add_argument('--summary-interval', type=float, default=60., help='seconds between printed progress summaries')
+    args = parser.parse_args()
+    year = args.year
+    region = args.region
     print('Year, Region: '+str(year)+' '+region,flush=True)
 
+# technologies simulated by default, each has its own output file
+TECHNOLOGIES = ["solar", "wind"]
+
+# value written for cells and technologies that are not simulated, read back as masked like cells never written
+CF_FILL_VALUE = default_fillvals['f4']
+
+# nameplate capacity (kW) of the simulated solar plant and wind turbine
+SOLAR_NAMEPLATE_CAPACITY = 1000
+WIND_NAMEPLATE_CAPACITY = 1500
+
+# hub height (m) of the simulated wind turbine, used by create_wind_model and run_wp_batch
+WIND_HUB_HEIGHT = 80
+
+# variables read from the processed MERRA file, each stored as (cell, day, hour)
+MERRA_VARIABLES = ['SWGDN', 'U2M', 'V2M', 'U10M', 'V10M', 'U50M', 'V50M', 'T2M', 'PS']
+
 def get_lat_lon(processed_merra_file):
 
     data = Dataset(processed_merra_file)
@@ -31,7 +86,7 @@ def get_lat_lon(processed_merra_file):
 
 def get_power_curve(power_curve_file):
 
-    raw_data = pd.read_excel("wind_turbine_power_curves.xlsx")
+    raw_data = asset_cache.read_excel_cached(power_curve_file)
 
     #creates dict within dict for each composite wind class, redundancy in speed but left in case needed in future uses
     power_curve = dict()
@@ -42,31 +97,45 @@ def get_power_curve(power_curve_file):
 
     return power_curve
 
-def create_netCDF_files(year, lats, lons, destination):
-    solar_name = destination + str(year) + "_solar_generation_cf.nc"
-    solar = Dataset(solar_name, "w")
-    lat = solar.createDimension("lat",lats.size)
-    lon = solar.createDimension("lon",lons.size)
-    hour = solar.createDimension("hour", 8760)
-    solar_cf = solar.createVariable("cf","f4",("lat","lon","hour",))
-    latitude = solar.createVariable("lat", "f4",("lat",))
-    longitude = solar.createVariable("lon", "f4",("lon",))
-    latitude[:] = lats
-    longitude[:] = lons
-    solar.close()
-    
-    
-    wind_name = destination + str(year) + "_wind_generation_cf.nc"
-    wind = Dataset(wind_name, "w")
-    lat = wind.createDimension("lat",lats.size)
-    lon = wind.createDimension("lon",lons.size)
-    hour = wind.createDimension("hour", 8760)
-    wind_cf = wind.createVariable("cf","f4",("lat","lon","hour",))
-    latitude = solar.createVariable("lat", "f4",("lat",))
-    longitude = solar.createVariable("lon", "f4",("lon",))
-    latitude[:] = lats
-    longitude[:] = lons
-    wind.close()
+def get_cf_file_name(year, technology, destination, shard=None):
+    # shard is (shard_index, num_shards) for the partial output of one task of a job array
+    if shard is None:
+        return destination + str(year) + "_" + technology + "_generation_cf.nc"
+    return destination + str(year) + "_" + technology + "_generation_cf_shard" + str(shard[0]) + "of" + str(shard[1]) + ".nc"
+
+# int16 packing of quantized cf outputs, cf = stored value * CF_SCALE_FACTOR (steps of 1e-4, up to 3.2767)
+CF_SCALE_FACTOR = 1e-4
+
+def get_chunk_shape(layout, num_lats, num_lons):
+    # (lat, lon, hour) chunks of the cf outputs for the way they will be read:
+    # 'time' for reading hours across the whole region (a day of the whole region per chunk),
+    # 'cell' for reading the year of single cells (one cell per chunk), 'default' leaves storage to netCDF
+    if layout == 'time':
+        return (num_lats, num_lons, 24)
+    if layout == 'cell':
+        return (1, 1, 8760)
+    return None
+
+def create_netCDF_files(year, lats, lons, destination, chunk_shape=None, complevel=0, shard=None, quantize=False, technologies=TECHNOLOGIES, variables=None):
+    # chunk_shape is (lat, lon, hour) chunk sizes for cf (None leaves storage to netCDF), complevel > 0 turns on zlib compression,
+    # quantize stores cf as int16 with a scale factor (unpacked to floats again by netCDF readers), files of other technologies are left as they are,
+    # variables maps a technology to the names of its cf variables (one per configuration of a sweep), None is a single 'cf'
+    for technology in technologies:
+        file_name = get_cf_file_name(year, technology, destination, shard)
+        data = Dataset(file_name, "w")
+        lat = data.createDimension("lat",lats.size)
+        lon = data.createDimension("lon",lons.size)
+        hour = data.createDimension("hour", 8760)
+        for name in (variables[technology] if variables is not None else ["cf"]):
+            cf = data.createVariable(name,"i2" if quantize else "f4",("lat","lon","hour",), zlib=complevel > 0, complevel=max(complevel, 1), chunksizes=chunk_shape)
+            if quantize:
+                cf.scale_factor = CF_SCALE_FACTOR
+                cf.add_offset = 0.
+        latitude = data.createVariable("lat", "f4",("lat",))
+        longitude = data.createVariable("lon", "f4",("lon",))
+        latitude[:] = lats
+        longitude[:] = lons
+        data.close()
     return 0
 
 def create_csv(year, latitude, longitude): #lat lon in degrees
@@ -103,43 +172,57 @@ def get_date(jd):
         day = jd
     return month, day      
 
+def get_tile_data(merra_data, start, stop):
+    """ Reads the resource for cells start:stop of the processed vector with one contiguous read per variable
+
+    ...
+
+    Args:
+    ----------
+    `merra_data` (Dataset): open processed MERRA netcdf
+
+    `start` (int): first cell of the tile (cell = latitude * num_lons + longitude)
+
+    `stop` (int): cell after the last cell of the tile
+
+    Returns:
+    ----------
+    `ghi`, `temperature`, `pressure`, `windSpeed2`, `windSpeed10`, `windSpeed50`, `windDirection` (np array): hourly
+    resource values with shape (cells, hours), same units as get_data
+
+    """
+    num_cells = stop - start
+    raw_data = dict()
+    for variable in MERRA_VARIABLES:
+        values = np.array(merra_data.variables[variable][start:stop, :, :])
+        raw_data[variable] = values.reshape(num_cells, int(values.size / num_cells))
+
+    ghi = raw_data['SWGDN']
+    pressure = raw_data['PS'] / 101325.0
+    windSpeed2 = (raw_data['V2M']**2 + raw_data['U2M']**2)**.5
+    windSpeed10 = (raw_data['V10M']**2 + raw_data['U10M']**2)**.5
+    windSpeed50 = (raw_data['V50M']**2 + raw_data['U50M']**2)**.5
+    windDirection = get_windDirection(raw_data['U50M'], raw_data['V50M'])
+    temperature = (raw_data['T2M'] - 273.15)
+
+    return ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection
+
 def get_data(latitude, longitude, num_lons, merra_data):
     
     latLon = latitude * num_lons + longitude # Processed data comes in vector form
-    
-    ghi = np.squeeze(np.array(merra_data.variables['SWGDN'][latLon, :, :]))
-    ghi = ghi.reshape(ghi.size)
-    v10m = np.squeeze(np.array(merra_data.variables['V10M'][latLon, :, :]))
-    v10m = v10m.reshape(v10m.size)
-    u2m = np.squeeze(np.array(merra_data.variables['U2M'][latLon, :, :]))
-    u2m =u2m.reshape(u2m.size)
-    v2m = np.squeeze(np.array(merra_data.variables['V2M'][latLon, :, :]))
-    v2m = v2m.reshape(v2m.size)
-    u10m = np.squeeze(np.array(merra_data.variables['U10M'][latLon, :, :]))
-    u10m = u10m.reshape(u10m.size)
-    v10m = np.squeeze(np.array(merra_data.variables['V10M'][latLon, :, :]))
-    v10m = v10m.reshape(v10m.size)
-    u50m = np.squeeze(np.array(merra_data.variables['U50M'][latLon, :, :]))
-    u50m = u50m.reshape(u50m.size)
-    v50m = np.squeeze(np.array(merra_data.variables['V50M'][latLon, :, :]))
-    v50m = v50m.reshape(v50m.size)
-    t2m = np.squeeze(np.array(merra_data.variables['T2M'][latLon, :, :]))
-    t2m = t2m.reshape(t2m.size)
-    pressure_Pa = np.squeeze(np.array(merra_data.variables['PS'][latLon, :, :]))
-    pressure_Pa = pressure_Pa.reshape(pressure_Pa.size)
-    
-    pressure = pressure_Pa / 101325.0
-    windSpeed2 = (v2m**2 + u2m**2)**.5
-    windSpeed10 = (v10m**2 + u10m**2)**.5
-    windSpeed50 = (v50m**2 + u50m**2)**.5
-    windDirection = get_windDirection(u50m, v50m)
-    temperature = (t2m - 273.15)
-    
+    tile_data = get_tile_data(merra_data, latLon, latLon + 1)
+    ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = [values[0] for values in tile_data]
+
     return ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection 
 
+def get_cell_indices(start, stop, num_lons):
+    # latitude and longitude indices of cells start:stop of the processed vector
+    cells = np.arange(start, stop)
+    return cells // num_lons, cells % num_lons
+
 def get_windDirection(u50m, v50m):
     
-    direction = np.zeros(u50m.size)
+    direction = np.zeros(u50m.shape)
     eastward = np.logical_and(u50m > 0, v50m != 0) 
     westward = np.logical_and(u50m < 0, v50m != 0)
     pure_northward = np.logical_and(u50m == 0, v50m > 0)
@@ -156,6 +239,7 @@ def get_windDirection(u50m, v50m):
     return direction
 
 def get_date_time_index(year, month, day):
+    import pandas as pd
     if day < 10:
         two_dig_day = ['00', '01', '02', '03', '04', '05', '06', '07', '08', '09']
         str_day = two_dig_day[day]
@@ -171,6 +255,7 @@ def get_date_time_index(year, month, day):
 
 # PVLIB from Sandia National Laboratory to estimate dni/dhi from ghi using DISC model
 def get_dni_dhi(year, jd, month, day, latitude, longitude, ghi):
+    import pvlib
     latitude_rads = latitude * 3.14159 / 180.0
     times = get_date_time_index(year, month, day)
     eqt = pvlib.solarposition.equation_of_time_pvcdrom(jd) # find 'equation of time' of given day (in minutes) 
@@ -185,6 +270,216 @@ def get_dni_dhi(year, jd, month, day, latitude, longitude, ghi):
     dhi = ghi - dni * np.cos(zen_rads)
     return dni, dhi
 
+def get_annual_date_time_index(year, num_days=365):
+    # hourly index for the whole year, dates follow get_date so leap days are skipped like the MERRA data
+    import pandas as pd
+    months, days, hours = get_resource_dates(num_days)
+    times = pd.to_datetime(pd.DataFrame({'year': year, 'month': months, 'day': days, 'hour': hours}))
+    return pd.DatetimeIndex(times)
+
+def get_dirint_batch(ghi, zen, day_of_year):
+    """ DIRINT model of pvlib.irradiance.dirint evaluated for many days and cells at once
+
+    ...
+
+    Args:
+    ----------
+    `ghi` (np array): global horizontal irradiance, last axis is the 24 hours of one day
+
+    `zen` (np array): solar zenith angles (degrees) broadcastable to ghi
+
+    `day_of_year` (np array): calendar day of year broadcastable to ghi (used for extraterrestrial radiation)
+
+    Returns:
+    ----------
+    `dni` (np array): direct normal irradiance, same shape as ghi (nan replaced by 0)
+
+    """
+    import pvlib
+    try:
+        # private to pvlib (checked with 0.10), versions without it decompose one day at a time through the public dirint
+        coeffs = pvlib.irradiance._get_dirint_coeffs()
+    except AttributeError:
+        return get_dirint_by_day(ghi, zen, day_of_year)
+
+    disc_out = pvlib.irradiance.disc(ghi, zen, day_of_year, pressure=None, min_cos_zenith=0.0, max_zenith=90)
+    kt_prime = pvlib.irradiance.clearness_index_zenith_independent(disc_out['kt'], disc_out['airmass'], max_clearness_index=1)
+
+    # stability index (Perez eqn 2 and 3), taken within each day since dirint was called day by day
+    kt_next = np.empty_like(kt_prime)
+    kt_next[..., :-1] = kt_prime[..., 1:]
+    kt_next[..., -1] = kt_prime[..., -2]
+    kt_previous = np.empty_like(kt_prime)
+    kt_previous[..., 1:] = kt_prime[..., :-1]
+    kt_previous[..., 0] = kt_prime[..., 1]
+    delta_next = np.abs(kt_prime - kt_next)
+    delta_previous = np.abs(kt_prime - kt_previous)
+    delta_kt_prime = 0.5 * np.where(np.isnan(delta_next) & np.isnan(delta_previous), np.nan, np.nan_to_num(delta_next) + np.nan_to_num(delta_previous))
+
+    # same bins as pvlib, no dew point so precipitable water always falls in the last bin
+    kt_prime_bin = np.select([(kt_prime >= 0) & (kt_prime < 0.24), (kt_prime >= 0.24) & (kt_prime < 0.4), (kt_prime >= 0.4) & (kt_prime < 0.56),
+                              (kt_prime >= 0.56) & (kt_prime < 0.7), (kt_prime >= 0.7) & (kt_prime < 0.8), (kt_prime >= 0.8) & (kt_prime <= 1)], [1, 2, 3, 4, 5, 6], 0)
+    zenith_bin = np.select([(zen >= 0) & (zen < 25), (zen >= 25) & (zen < 40), (zen >= 40) & (zen < 55),
+                            (zen >= 55) & (zen < 70), (zen >= 70) & (zen < 80), (zen >= 80)], [1, 2, 3, 4, 5, 6], 0)
+    delta_kt_prime_bin = np.select([(delta_kt_prime >= 0) & (delta_kt_prime < 0.015), (delta_kt_prime >= 0.015) & (delta_kt_prime < 0.035),
+                                    (delta_kt_prime >= 0.035) & (delta_kt_prime < 0.07), (delta_kt_prime >= 0.07) & (delta_kt_prime < 0.15),
+                                    (delta_kt_prime >= 0.15) & (delta_kt_prime < 0.3), (delta_kt_prime >= 0.3) & (delta_kt_prime <= 1)], [1, 2, 3, 4, 5, 6], 0)
+    w_bin = 5
+
+    dirint_coeffs = coeffs[kt_prime_bin - 1, zenith_bin - 1, delta_kt_prime_bin - 1, w_bin - 1]
+    dirint_coeffs = np.where((kt_prime_bin == 0) | (zenith_bin == 0) | (delta_kt_prime_bin == 0), np.nan, dirint_coeffs)
+
+    dni = disc_out['dni'] * dirint_coeffs
+    return np.nan_to_num(dni, nan=0.0)
+
+def get_dirint_by_day(ghi, zen, day_of_year):
+    # get_dirint_batch with pvlib.irradiance.dirint called day by day as in get_dni_dhi, slower but only uses pvlib's public api
+    import pandas as pd
+    import pvlib
+    day_ghi = np.asarray(ghi).reshape(-1, 24)
+    day_zen = np.broadcast_to(zen, np.shape(ghi)).reshape(-1, 24)
+    day_doy = np.broadcast_to(day_of_year, np.shape(ghi)).reshape(-1, 24)
+    dni = np.empty(day_ghi.shape)
+    for day in range(day_ghi.shape[0]):
+        # dirint only uses the day of year of the times, a leap year has an index for each of them
+        times = pd.DatetimeIndex(pd.Timestamp('2016-01-01') + pd.to_timedelta(day_doy[day] - 1, 'D') + pd.to_timedelta(np.arange(24), 'h'))
+        dni_temp = pvlib.irradiance.dirint(pd.Series(day_ghi[day], index=times), pd.Series(day_zen[day], index=times), times,
+            pressure=None, use_delta_kt_prime=True, temp_dew=None, min_cos_zenith=0.0, max_zenith=90)
+        dni[day] = np.array(dni_temp.fillna(0))
+    return dni.reshape(np.shape(ghi))
+
+def get_solar_geometry(latitudes, longitudes, num_days=365):
+    """ Hourly sun position of many cells as used by get_dni_dhi, which only depends on the cell and the day of the MERRA calendar
+
+    ...
+
+    Args:
+    ----------
+    `latitudes` (np array): latitude of each cell in degrees
+
+    `longitudes` (np array): longitude of each cell in degrees
+
+    `num_days` (int): days of the year, leap days are skipped like the MERRA data so jd 60 is March 1st in every year
+
+    Returns:
+    ----------
+    `zenith` (np array): solar zenith angle (degrees), shape (cells, num_days * 24)
+
+    `cos_zenith` (np array): cosine of the zenith angle, shape (cells, num_days * 24)
+
+    `hour_angle` (np array): hour angle (degrees), shape (cells, num_days * 24)
+
+    """
+    import pvlib
+    num_cells = np.size(latitudes)
+    jd = np.arange(1, num_days + 1)
+    hours = np.tile(np.arange(24), num_days).reshape(1, num_days, 24)
+
+    latitude_rads = np.asarray(latitudes, dtype=float).reshape(num_cells, 1, 1) * 3.14159 / 180.0
+    longitude = np.asarray(longitudes, dtype=float).reshape(num_cells, 1, 1)
+    eqt = pvlib.solarposition.equation_of_time_pvcdrom(jd).reshape(1, num_days, 1) # 'equation of time' of each day (in minutes)
+    dec_rads = pvlib.solarposition.declination_spencer71(jd).reshape(1, num_days, 1) # 'solar declination' of each day (in radians)
+    ha = 15. * (hours - 12.) + longitude + eqt / 4. # 'hour angles' (degrees), as in pvlib.solarposition.hour_angle
+    ha_rads = ha * np.pi / 180.
+    zen_rads = pvlib.solarposition.solar_zenith_analytical(latitude_rads, ha_rads, dec_rads)
+    zen = zen_rads * 180. / np.pi
+
+    shape = (num_cells, num_days * 24)
+    return zen.reshape(shape), np.cos(zen_rads).reshape(shape), ha.reshape(shape)
+
+def get_solar_geometry_file_name(processed_merra_path, region, num_days=365):
+    return processed_merra_path + 'solarGeometry' + region + '_' + str(num_days) + 'days.nc'
+
+def create_solar_geometry_file(file_name, lats, lons, num_days=365, tile_size=256):
+    """ Writes the sun position of every cell of a region once, it is read back for every year and rerun of the region
+
+    ...
+
+    Args:
+    ----------
+    `file_name` (str): netcdf to write (see get_solar_geometry_file_name)
+
+    `lats`, `lons` (np array): latitudes and longitudes of the region, cells in the processed vector order
+
+    `num_days` (int): days of the MERRA year
+
+    `tile_size` (int): cells computed at once
+
+    """
+    # written under a temporary name and moved in place when complete, so an interrupted job never leaves a partial table
+    temp_file = file_name + '.' + str(os.getpid()) + '.tmp'
+    data = Dataset(temp_file, "w")
+    data.createDimension("lat", lats.size)
+    data.createDimension("lon", lons.size)
+    data.createDimension("cell", lats.size * lons.size)
+    data.createDimension("hour", num_days * 24)
+    data.createVariable("lat", "f4", ("lat",))[:] = lats
+    data.createVariable("lon", "f4", ("lon",))[:] = lons
+    for name in ["zenith", "cos_zenith", "hour_angle"]:
+        data.createVariable(name, "f8", ("cell", "hour",), chunksizes=(min(tile_size, lats.size * lons.size), num_days * 24))
+    for tile_start, tile_stop in get_tiles(lats.size * lons.size, tile_size):
+        tile_lats, tile_lons = get_cell_indices(tile_start, tile_stop, lons.size)
+        zenith, cos_zenith, hour_angle = get_solar_geometry(lats[tile_lats], lons[tile_lons], num_days)
+        data.variables["zenith"][tile_start:tile_stop, :] = zenith
+        data.variables["cos_zenith"][tile_start:tile_stop, :] = cos_zenith
+        data.variables["hour_angle"][tile_start:tile_stop, :] = hour_angle
+    data.close()
+    os.replace(temp_file, file_name)
+    return file_name
+
+def get_solar_geometry_file(processed_merra_path, region, lats, lons, num_days=365):
+    # the region's geometry table, built on the first run (or if the grid changed) and reused afterwards
+    file_name = get_solar_geometry_file_name(processed_merra_path, region, num_days)
+    if os.path.isfile(file_name):
+        data = Dataset(file_name)
+        same_grid = np.array_equal(np.array(data.variables["lat"][:]), lats.astype("f4")) and np.array_equal(np.array(data.variables["lon"][:]), lons.astype("f4"))
+        data.close()
+        if same_grid:
+            return file_name
+    print('Building solar geometry table ' + file_name, flush=True)
+    return create_solar_geometry_file(file_name, lats, lons, num_days)
+
+def get_dni_dhi_batch(year, latitudes, longitudes, ghi, solar_geometry=None):
+    """ Whole-year version of get_dni_dhi for many cells at once
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the resource data
+
+    `latitudes` (np array): latitude of each cell in degrees
+
+    `longitudes` (np array): longitude of each cell in degrees
+
+    `ghi` (np array): hourly global horizontal irradiance, shape (cells, 8760)
+
+    `solar_geometry` (tuple): (zenith, cos_zenith) of the cells from get_solar_geometry or the region's geometry table,
+    computed here if not given
+
+    Returns:
+    ----------
+    `dni`, `dhi` (np array): hourly direct normal and diffuse horizontal irradiance, shape (cells, 8760)
+
+    """
+    ghi = np.asarray(ghi)
+    num_cells = ghi.shape[0]
+    num_days = int(ghi.shape[1] / 24)
+    ghi = ghi.reshape(num_cells, num_days, 24)
+
+    # the calendar day of each hour, the only part of the decomposition that changes with leap years
+    times = get_annual_date_time_index(year, num_days)
+    day_of_year = np.array(times.dayofyear).reshape(1, num_days, 24)
+
+    if solar_geometry is None:
+        solar_geometry = get_solar_geometry(latitudes, longitudes, num_days)[:2]
+    zen = solar_geometry[0].reshape(num_cells, num_days, 24)
+    cos_zen = solar_geometry[1].reshape(num_cells, num_days, 24)
+
+    dni = get_dirint_batch(ghi, zen, day_of_year)
+    dhi = ghi - dni * cos_zen
+    return dni.reshape(num_cells, num_days * 24), dhi.reshape(num_cells, num_days * 24)
+
 def write_day2csv(solar_csv, year, month, day, dni, dhi, windSpeed, temperature):
     with open(solar_csv, 'a', newline='') as csvfile:
         for i in range(24):
@@ -201,34 +496,160 @@ def write_2srw(wind_srw, temperature, pressure, windSpeed2, windSpeed10, windSpe
         csvfile.flush()
         csvfile.close()
 
-def run_solar(solar_csv, latitude):
+def get_resource_dates(num_days=365):
+    months = np.zeros(num_days * 24, dtype=int)
+    days = np.zeros(num_days * 24, dtype=int)
+    for jd in range(num_days):
+        months[jd*24:(jd+1)*24], days[jd*24:(jd+1)*24] = get_date(jd + 1)
+    hours = np.tile(np.arange(24), num_days)
+    return months, days, hours
+
+def get_solar_resource_data(year, latitude, longitude, dni, dhi, windSpeed, temperature):
+    """ Builds the in-memory equivalent of the solar csv written by create_csv and write_day2csv
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the resource data (leap days are skipped, see get_date)
+
+    `latitude` (float): latitude of the cell in degrees
+
+    `longitude` (float): longitude of the cell in degrees
+
+    `dni`, `dhi`, `windSpeed`, `temperature` (np array): hourly resource values for the whole year
+
+    Returns:
+    ----------
+    `solar_resource` (dict): PVWatts v7 solar_resource_data table
+
+    """
+    months, days, hours = get_resource_dates(int(dni.size / 24))
+    solar_resource = dict()
+    solar_resource['lat'] = float(latitude)
+    solar_resource['lon'] = float(longitude)
+    solar_resource['tz'] = 0
+    solar_resource['elev'] = 500
+    solar_resource['year'] = [year] * dni.size
+    solar_resource['month'] = months.tolist()
+    solar_resource['day'] = days.tolist()
+    solar_resource['hour'] = hours.tolist()
+    solar_resource['minute'] = [30] * dni.size # SAM requires minutes for data tables, sun position is taken mid-hour
+    solar_resource['dn'] = np.asarray(dni, dtype=float).tolist()
+    solar_resource['df'] = np.asarray(dhi, dtype=float).tolist()
+    solar_resource['wspd'] = np.asarray(windSpeed, dtype=float).tolist()
+    solar_resource['tdry'] = np.asarray(temperature, dtype=float).tolist()
+    return solar_resource
+
+def get_wind_resource_data(year, latitude, longitude, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection):
+    """ Builds the in-memory equivalent of the wind srw written by create_srw and write_2srw
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the resource data
+
+    `latitude` (float): latitude of the cell in degrees
+
+    `longitude` (float): longitude of the cell in degrees
+
+    `temperature`, `pressure`, `windSpeed2`, `windSpeed10`, `windSpeed50`, `windDirection` (np array): hourly resource values
+    in the same units as the srw columns (C, atm, m/s, degrees)
+
+    Returns:
+    ----------
+    `wind_resource` (dict): Windpower wind_resource_data table
+
+    """
+    wind_resource = dict()
+    wind_resource['year'] = year
+    wind_resource['lat'] = float(latitude)
+    wind_resource['lon'] = float(longitude)
+    wind_resource['heights'] = [2, 2, 2, 10, 50, 50]
+    wind_resource['fields'] = [1, 2, 3, 3, 3, 4] # temperature, pressure, speed, speed, speed, direction
+    columns = [temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection]
+    wind_resource['data'] = np.column_stack(columns).astype(float).tolist()
+    return wind_resource
+
+# preconfigured SAM models of this process, built on first use and reused for every cell so only the resource,
+# tilt and power curve change between executions (one model per resource kind and configuration, a model keeps whichever resource was set last)
+sam_models = dict()
+
+# settings of a solar or wind configuration (see sweep.py) and the SAM inputs they set, settings left out keep powGen's defaults
+SOLAR_CONFIG_PARAMETERS = {'tilt': 'tilt', 'azimuth': 'azimuth', 'array_type': 'array_type', 'gcr': 'gcr', 'dc_ac_ratio': 'dc_ac_ratio', 'inv_eff': 'inv_eff', 'losses': 'losses'}
+WIND_CONFIG_PARAMETERS = {'hub_height': 'wind_turbine_hub_ht', 'rotor_diameter': 'wind_turbine_rotor_diameter', 'turbine': None}
+
+def create_solar_model(config=None):
+    import PySAM.Pvwattsv7 as pv
     s = pv.default("PVWattsNone")
-    
+
     ##### Parameters #######
-    s.SolarResource.solar_resource_file = solar_csv
     s.SystemDesign.array_type = 0
     s.SystemDesign.azimuth = 180
-    s.SystemDesign.tilt = abs(latitude)
-    nameplate_capacity = 1000 #kw
-    s.SystemDesign.system_capacity = nameplate_capacity   # System Capacity (kW)
+    s.SystemDesign.system_capacity = SOLAR_NAMEPLATE_CAPACITY   # System Capacity (kW)
     s.SystemDesign.dc_ac_ratio = 1.1 #DC to AC ratio
     s.SystemDesign.inv_eff = 96 #default inverter eff @ rated power (%)
     s.SystemDesign.losses = 14 #other DC losses (%) (14% is default from documentation)
     ########################
+
+    # settings of a configuration, a tilt of None is the cell's latitude (set by run_solar)
+    for setting, value in (config or {}).items():
+        if setting in SOLAR_CONFIG_PARAMETERS and value is not None:
+            setattr(s.SystemDesign, SOLAR_CONFIG_PARAMETERS[setting], value)
+
+    return s
+
+def create_wind_model(config=None):
+    import PySAM.Windpower as wp
+    d = wp.default("WindPowerNone")
+
+    ##### Parameters #######
+    d.Resource.wind_resource_model_choice = 0
+    d.Turbine.wind_turbine_rotor_diameter = 90
+    d.Turbine.wind_turbine_hub_ht = WIND_HUB_HEIGHT
+    d.Farm.system_capacity = WIND_NAMEPLATE_CAPACITY # System Capacity (kW)
+    d.Farm.wind_farm_wake_model = 0
+    d.Farm.wind_farm_xCoordinates = np.array([0]) # Lone turbine (centered at position 0,0 in farm)
+    d.Farm.wind_farm_yCoordinates = np.array([0])
+    ########################
+
+    # settings of a configuration, the turbine curve is set by run_wp
+    for setting, value in (config or {}).items():
+        if WIND_CONFIG_PARAMETERS.get(setting) is not None and value is not None:
+            setattr(d.Turbine, WIND_CONFIG_PARAMETERS[setting], value)
+
+    return d
+
+def get_sam_model(technology, in_memory, config=None):
+    # config is a solar or wind configuration dict, None for powGen's defaults
+    key = (technology, in_memory)
+    if config is not None:
+        key += tuple(sorted((setting, value) for setting, value in config.items() if setting != 'name'))
+    if key not in sam_models:
+        sam_models[key] = create_solar_model(config) if technology == 'solar' else create_wind_model(config)
+    return sam_models[key]
+
+def run_solar(solar_resource, latitude, config=None):
+    # resource is either a csv file path or a table from get_solar_resource_data, config a solar configuration (None for the defaults)
+    in_memory = isinstance(solar_resource, dict)
+    s = get_sam_model('solar', in_memory, config)
+    if in_memory:
+        s.SolarResource.solar_resource_data = solar_resource
+    else:
+        s.SolarResource.solar_resource_file = solar_resource
+    tilt = config.get('tilt') if config is not None else None
+    s.SystemDesign.tilt = abs(latitude) if tilt is None else tilt
     
     s.execute()
-    output_cf = np.array(s.Outputs.ac) / (nameplate_capacity * 1000) #convert AC generation (w) to capacity factor
+    output_cf = np.array(s.Outputs.ac) / (SOLAR_NAMEPLATE_CAPACITY * 1000) #convert AC generation (w) to capacity factor
     
     return output_cf
 
-def run_wp(wind_srw, wind_class, power_curve):
-
-    d = wp.default("WindPowerNone")
+def get_turbine_curve(wind_class, power_curve):
 
     #assigning values for respective wind power classes
     if  wind_class == 4:
-        powerout = power_curve['Vestas 7MW']['powerout']
-        speed = power_curve['Vestas 7MW']['powerout']
         #here is where one can put in the specific power class data for OFFSHORE turbines(may need to restructure as there may not be a single offshore turbine needed)
         #Currently treating them as a IEC level 1
         powerout = power_curve["Composite IEC Class I"]["powerout"]
@@ -242,26 +663,88 @@ def run_wp(wind_srw, wind_class, power_curve):
     else:
         powerout = power_curve["Composite IEC Class III"]["powerout"]
         speed = power_curve["Composite IEC Class III"]["speed"]
-        
-    ##### Parameters #######
-    d.Resource.wind_resource_filename = wind_srw
-    d.Resource.wind_resource_model_choice = 0
+
+    return speed, powerout
+
+def run_wp(wind_resource, wind_class, power_curve, config=None):
+    # resource is either a srw file path or a table from get_wind_resource_data, config a wind configuration (None for the defaults)
+    in_memory = isinstance(wind_resource, dict)
+    d = get_sam_model('wind', in_memory, config)
+    if in_memory:
+        d.Resource.wind_resource_data = wind_resource
+    else:
+        d.Resource.wind_resource_filename = wind_resource
+
+    # the power curve of the cell's IEC class, unless the configuration names a curve of power_curve for every cell
+    turbine = config.get('turbine') if config is not None else None
+    if turbine is None:
+        speed, powerout = get_turbine_curve(wind_class, power_curve)
+    else:
+        speed, powerout = power_curve[turbine]["speed"], power_curve[turbine]["powerout"]
     d.Turbine.wind_turbine_powercurve_powerout = powerout
     d.Turbine.wind_turbine_powercurve_windspeeds = speed
-    d.Turbine.wind_turbine_rotor_diameter = 90
-    d.Turbine.wind_turbine_hub_ht = 80
-    nameplate_capacity = 1500 #kw
-    d.Farm.system_capacity = nameplate_capacity # System Capacity (kW)
-    d.Farm.wind_farm_wake_model = 0
-    d.Farm.wind_farm_xCoordinates = np.array([0]) # Lone turbine (centered at position 0,0 in farm)
-    d.Farm.wind_farm_yCoordinates = np.array([0])
-    ########################
     
     d.execute()
-    output_cf = np.array(d.Outputs.gen) / nameplate_capacity #convert AC generation (kw) to capacity factor
+    output_cf = np.array(d.Outputs.gen) / WIND_NAMEPLATE_CAPACITY #convert AC generation (kw) to capacity factor
     
     return output_cf
 
+# losses (%) of the Losses group of SAM's WindPowerNone configuration, which create_wind_model keeps, by SAM input name.
+# SAM applies them one after another. Kept here so the numpy engine doesn't need PySAM, validate_engines.py checks them against SAM
+WIND_LOSSES = {'avail_bop_loss': 0.5, 'avail_grid_loss': 1.5, 'avail_turb_loss': 3.58,
+               'elec_eff_loss': 1.91, 'elec_parasitic_loss': 0.1,
+               'env_degrad_loss': 1.8, 'env_env_loss': 0.4, 'env_exposure_loss': 0.0, 'env_icing_loss': 0.21,
+               'ops_env_loss': 1.0, 'ops_grid_loss': 0.84, 'ops_load_loss': 0.99, 'ops_strategies_loss': 0.0,
+               'turb_generic_loss': 1.7, 'turb_hysteresis_loss': 0.4, 'turb_perf_loss': 1.1, 'turb_specific_loss': 0.81,
+               'wake_ext_loss': 1.1, 'wake_future_loss': 0.0, 'wake_int_loss': 0.0}
+
+def run_wp_batch(temperature, pressure, windSpeed50, wind_classes, power_curve, hub_height=WIND_HUB_HEIGHT, shear=0.14, nameplate_capacity=WIND_NAMEPLATE_CAPACITY):
+    """ NumPy version of run_wp for many cells at once (single turbine, no wake, as run_wp is configured)
+
+    ...
+
+    Args:
+    ----------
+    `temperature` (np array): hourly temperature (C), shape (cells, hours)
+
+    `pressure` (np array): hourly pressure (atm), shape (cells, hours)
+
+    `windSpeed50` (np array): hourly 50 meter wind speed (m/s), shape (cells, hours)
+
+    `wind_classes` (np array): IEC wind class of each cell
+
+    `power_curve` (dict): power curves from get_power_curve
+
+    `hub_height` (float): turbine hub height (m)
+
+    `shear` (float): shear exponent, SAM's default is used as SAM only extrapolates from the measurement closest to hub height (50 m)
+
+    `nameplate_capacity` (float): turbine rating (kW)
+
+    Returns:
+    ----------
+    `output_cf` (np array): hourly capacity factors, shape (cells, hours)
+
+    """
+    # extrapolate 50 meter speeds to hub height
+    hubSpeed = windSpeed50 * (hub_height / 50.) ** shear
+
+    # correct the speed for air density relative to 15 C and 1 atm, as SAM does before reading the power curve
+    density_ratio = pressure * 288.15 / (temperature + 273.15)
+    adjustedSpeed = hubSpeed * density_ratio ** (1. / 3.)
+
+    gross = np.zeros(adjustedSpeed.shape)
+    wind_classes = np.asarray(wind_classes)
+    for wind_class in np.unique(wind_classes):
+        cells = wind_classes == wind_class
+        speed, powerout = get_turbine_curve(wind_class, power_curve)
+        gross[cells] = np.interp(adjustedSpeed[cells], speed, powerout, left=0, right=0)
+
+    loss_factor = np.prod(1 - np.array(list(WIND_LOSSES.values())) / 100.)
+    output_cf = gross * loss_factor / nameplate_capacity
+
+    return output_cf
+
 def write_cord(year, solar_outputs, wind_outputs, lat, lon, destination):
     solar_name = destination + str(year) + "_solar_generation_cf.nc"
     solar = Dataset(solar_name, "a")
@@ -276,24 +759,850 @@ def write_cord(year, solar_outputs, wind_outputs, lat, lon, destination):
     wind.close()
     return 0
 
-def main(year,region):
-        
-    print('Begin Program: \t {:%Y-%m-%d %H:%M:%S}'.format(datetime.datetime.now()))
+class CFWriter:
+    """ Keeps the solar and wind capacity factor netcdfs open and writes finished cells in blocks
 
-    root_directory = '/scratch/mtcraig_root/mtcraig1/shared_data/'
+    ...
 
-    processed_merra_path = root_directory + 'merraData/resource/' + region + '/processed/'
+    Args:
+    ----------
+    `year` (int): year of the output files
+
+    `destination` (str): folder the files were created in by create_netCDF_files
+
+    `shard` (tuple): (shard_index, num_shards) to write the partial files of one shard, None for the full files
+
+    `technologies` (list): technologies whose files are written, outputs of the others are dropped
+
+    `variables` (dict): names of the cf variables of each technology as given to create_netCDF_files, None is a single 'cf'.
+    With several variables the outputs of a cell are given as an array of shape (variables, hours)
+
+    """
+
+    def __init__(self, year, destination, shard=None, technologies=TECHNOLOGIES, variables=None):
+        self.files = {technology: Dataset(get_cf_file_name(year, technology, destination, shard), "a") for technology in technologies}
+        self.variables = {technology: variables[technology] if variables is not None else ['cf'] for technology in technologies}
+        # files are synced after every flush so a resumed run finds all written cells, except with the chunks below
+        self.sync_interval = 0.
+        for technology, data in self.files.items():
+            for name in self.variables[technology]:
+                # chunks split along the hours (time layout) are touched by every write, so they are all kept in the cache
+                # instead of being compressed and rewritten on every flush, syncing would empty the cache so it only happens every 10 minutes.
+                # Runs that are stopped (errors, SIGTERM of slurm's time limit or preemption, see stop_on_sigterm) still close and sync
+                # the files, only a hard kill (SIGKILL, node failure) can lose up to the last 10 minutes of tiles or leave the files unreadable
+                cf = data.variables[name]
+                chunking = cf.chunking()
+                if chunking != 'contiguous' and chunking[2] < cf.shape[2]:
+                    cf.set_var_chunk_cache(size=min(cf.size * cf.dtype.itemsize, 2 ** 30), nelems=int(np.prod([np.ceil(cf.shape[i] / chunking[i]) for i in range(3)])) + 1)
+                    self.sync_interval = 600.
+        self.last_sync = time.time()
+        self.cells = []
+        self.outputs = {technology: [] for technology in self.files}
+
+    def add(self, lat, lon, solar_outputs, wind_outputs):
+        # buffer one cell until the next flush
+        self.cells.append((lat, lon))
+        for technology, outputs in zip(TECHNOLOGIES, [solar_outputs, wind_outputs]):
+            if technology in self.files:
+                self.outputs[technology].append(outputs)
+
+    def flush(self):
+        # write buffered cells as runs of neighbouring longitudes, one write per run and file
+        if len(self.cells) == 0:
+            return
+        order = sorted(range(len(self.cells)), key=lambda i: self.cells[i])
+        run = [order[0]]
+        for i in order[1:] + [None]:
+            if i is not None and self.cells[i][0] == self.cells[run[-1]][0] and self.cells[i][1] == self.cells[run[-1]][1] + 1:
+                run.append(i)
+                continue
+            lat, lon = self.cells[run[0]]
+            for technology, data in self.files.items():
+                # fill values are written masked so they also become the fill value of quantized files
+                names = self.variables[technology]
+                values = np.array([self.outputs[technology][j] for j in run]).reshape(len(run), len(names), -1)
+                for index, name in enumerate(names):
+                    variable = data.variables[name]
+                    output = np.ma.masked_equal(values[:, index], CF_FILL_VALUE)
+                    if variable.dtype == np.int16:
+                        # netCDF4 packs masked entries and the array's fill value as well, the float fill value doesn't fit int16,
+                        # so both are given the int16 fill value (unpacked) first
+                        output.data[np.ma.getmaskarray(output)] = default_fillvals['i2'] * CF_SCALE_FACTOR
+                        output.fill_value = default_fillvals['i2'] * CF_SCALE_FACTOR
+                    variable[lat, lon:lon + len(run), :] = output
+            run = [i]
+        if time.time() - self.last_sync >= self.sync_interval:
+            for data in self.files.values():
+                data.sync()
+            self.last_sync = time.time()
+        self.cells = []
+        self.outputs = {technology: [] for technology in self.files}
+
+    def close(self):
+        self.flush()
+        for data in self.files.values():
+            data.close()
 
+def simulate_cell(year, latitude, longitude, dni, dhi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection, wind_class, power_curve, in_memory=False, solar_engine='sam', wind_engine='sam'):
+    """ Simulates solar and wind capacity factors for one cell with the System Advisory Model
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the resource data
+
+    `latitude` (float): latitude of the cell in degrees
+
+    `longitude` (float): longitude of the cell in degrees
+
+    `dni`, `dhi`, `temperature`, `pressure`, `windSpeed2`, `windSpeed10`, `windSpeed50`, `windDirection` (np array): hourly
+    resource values for the cell (see get_data and get_dni_dhi_batch)
+
+    `wind_class` (int): IEC wind class of the cell
+
+    `power_curve` (dict): power curves from get_power_curve
+
+    `in_memory` (bool): pass resource data to SAM directly instead of writing csv/srw files
+
+    `solar_engine`, `wind_engine` (str): only technologies with engine 'sam' are simulated here, the others come from the batch engines
+
+    Returns:
+    ----------
+    `solar_outputs`, `wind_outputs` (np array): hourly solar and wind capacity factors (None if not simulated with SAM)
+
+    """
+    run_sam_solar = solar_engine == 'sam'
+    run_sam_wind = wind_engine == 'sam'
+
+    solar_resource, wind_resource = get_cell_resource(year, latitude, longitude, dni, dhi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection,
+        in_memory, run_sam_solar, run_sam_wind)
+
+    # simulate generation with System Advisory Model
+    solar_outputs = None
+    wind_outputs = None
+    if run_sam_solar:
+        with metrics.stage('solar'):
+            solar_outputs = run_solar(solar_resource, latitude)
+    if run_sam_wind:
+        with metrics.stage('wind'):
+            wind_outputs = run_wp(wind_resource, wind_class, power_curve)
+
+    remove_cell_resource(solar_resource, wind_resource)
+
+    return solar_outputs, wind_outputs
+
+def get_cell_resource(year, latitude, longitude, dni, dhi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection, in_memory=False, solar=True, wind=True):
+    # SAM resource of one cell, tables (in_memory) or csv/srw files, None for a technology that is not simulated
+    solar_resource = None
+    wind_resource = None
+    with metrics.stage('resource'):
+        if in_memory:
+            # hand resource data to SAM directly instead of writing csv/srw files
+            if solar:
+                solar_resource = get_solar_resource_data(year, latitude, longitude, dni, dhi, windSpeed2, temperature)
+            if wind:
+                wind_resource = get_wind_resource_data(year, latitude, longitude, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection)
+        else:
+            # write wind resource data to srw for SAM
+            if wind:
+                wind_resource = create_srw(year, latitude, longitude)
+                write_2srw(wind_resource, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection)
+
+            # write solar resource data to csv for SAM
+            if solar:
+                solar_resource = create_csv(year, latitude, longitude)
+                for jd in range(int(dni.size / 24)):
+                    month, day = get_date(jd + 1)
+                    write_day2csv(solar_resource, year, month, day, dni[(jd)*24:(jd+1)*24], dhi[(jd)*24:(jd+1)*24], windSpeed2[(jd)*24:(jd+1)*24], temperature[(jd)*24:(jd+1)*24])
+    return solar_resource, wind_resource
+
+def remove_cell_resource(solar_resource, wind_resource):
+    # remove resource files of get_cell_resource (save space)
+    for resource in [solar_resource, wind_resource]:
+        if isinstance(resource, str):
+            os.remove(resource)
+
+# hash of the full parameter set of each (technology, engine, in_memory) for the result cache, computed once per process
+parameter_hashes = dict()
+
+def get_parameters_hash(technology, engine, in_memory):
+    # everything a technology's results depend on apart from the cell's weather, position and turbine curve
+    key = (technology, engine, in_memory)
+    if key not in parameter_hashes:
+        parameters = {'technology': technology, 'engine': engine, 'in_memory': in_memory,
+                      'nameplate_capacity': SOLAR_NAMEPLATE_CAPACITY if technology == 'solar' else WIND_NAMEPLATE_CAPACITY}
+        if engine == 'sam':
+            # every input of the configured SAM model (defaults included) and the SAM version
+            import PySAM
+            model = create_solar_model() if technology == 'solar' else create_wind_model()
+            parameters['model'] = {group: values for group, values in model.export().items() if group != 'Outputs'}
+            parameters['pysam'] = PySAM.__version__
+        elif technology == 'solar':
+            import pvwatts_engine
+            parameters['pvwatts_engine'] = asset_cache.get_file_hash(pvwatts_engine.__file__)
+        else:
+            parameters['run_wp_batch'] = run_wp_batch.__defaults__
+            parameters['losses'] = WIND_LOSSES
+        parameter_hashes[key] = result_cache.get_parameters_hash(parameters)
+    return parameter_hashes[key]
+
+def get_result_keys(year, latitudes, longitudes, resource, wind_classes, power_curve, in_memory=False, solar_engine='sam', wind_engine='sam'):
+    # result cache keys of the solar and wind outputs of every cell of a tile, resource is the tile's get_tile_data outputs
+    ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = resource
+    solar_hash = get_parameters_hash('solar', solar_engine, in_memory)
+    wind_hash = get_parameters_hash('wind', wind_engine, in_memory)
+    solar_keys = []
+    wind_keys = []
+    for cell in range(ghi.shape[0]):
+        solar_keys.append(result_cache.get_key('solar', year, solar_hash, latitudes[cell], longitudes[cell], [ghi[cell], windSpeed2[cell], temperature[cell]]))
+        speed, powerout = get_turbine_curve(wind_classes[cell], power_curve)
+        wind_keys.append(result_cache.get_key('wind', year, wind_hash, latitudes[cell], longitudes[cell],
+            [temperature[cell], pressure[cell], windSpeed2[cell], windSpeed10[cell], windSpeed50[cell], windDirection[cell], speed, powerout]))
+    return solar_keys, wind_keys
+
+def simulate_tile(year, merra_data, lat, lon, tile_start, tile_stop, wind_IEC_class, power_curve, in_memory=False, solar_engine='sam', wind_engine='sam', solar_geometry=None, simulate_mask=None, cell_cache=None):
+    """ Reads, decomposes and simulates cells tile_start:tile_stop of the processed vector
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the resource data
+
+    `merra_data` (Dataset): open processed MERRA netcdf
+
+    `lat`, `lon` (np array): latitudes and longitudes of the region
+
+    `tile_start`, `tile_stop` (int): range of cells to simulate (cell = latitude * num_lons + longitude)
+
+    `wind_IEC_class` (DataFrame): IEC wind class of each cell
+
+    `power_curve` (dict): power curves from get_power_curve
+
+    `in_memory` (bool): pass resource data to SAM directly instead of writing csv/srw files
+
+    `solar_engine` (str): 'sam' to simulate solar cell by cell with SAM, 'numpy' to use pvwatts_engine.run_solar_batch for the whole tile
+
+    `wind_engine` (str): 'sam' to simulate wind cell by cell with SAM, 'numpy' to use run_wp_batch for the whole tile
+
+    `solar_geometry` (Dataset): open solar geometry table of the region (see get_solar_geometry_file), None computes the sun position here
+
+    `simulate_mask` (tuple): (solar_needed, wind_needed) of every cell of the region from get_simulate_mask, None simulates everything
+
+    `cell_cache` (ResultCache): results of earlier runs, cells and technologies found there are not simulated again (None simulates everything)
+
+    Returns:
+    ----------
+    `tile_lats`, `tile_lons` (np array): latitude and longitude indices of the cells
+
+    `solar_outputs`, `wind_outputs` (np array): hourly solar and wind capacity factors, shape (cells, 8760), CF_FILL_VALUE where not needed
+
+    """
+    tile_data = read_tile(merra_data, tile_start, tile_stop, solar_geometry)
+    return compute_tile(year, lat, lon, tile_start, tile_stop, tile_data, wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, simulate_mask, cell_cache)
+
+def read_tile(merra_data, tile_start, tile_stop, solar_geometry=None, times=None):
+    # resource of cells tile_start:tile_stop and their sun position (None without a geometry table), times are the stage times it is added to
+    if isinstance(merra_data, dict):
+        # arrays of a shared resource directory (see create_shared_resource), the tile is a view of the mapped files
+        with metrics.stage('read', times):
+            resource = tuple(np.asarray(merra_data[name][tile_start:tile_stop]) for name in SHARED_RESOURCE_ARRAYS[:7])
+            tile_geometry = None
+            if 'zenith' in merra_data:
+                tile_geometry = (np.asarray(merra_data['zenith'][tile_start:tile_stop]), np.asarray(merra_data['cos_zenith'][tile_start:tile_stop]))
+        return resource, tile_geometry
+    with pipeline.netcdf_lock, metrics.stage('read', times):
+        resource = get_tile_data(merra_data, tile_start, tile_stop)
+        tile_geometry = None
+        if solar_geometry is not None:
+            tile_geometry = (np.array(solar_geometry.variables['zenith'][tile_start:tile_stop, :]), np.array(solar_geometry.variables['cos_zenith'][tile_start:tile_stop, :]))
+    return resource, tile_geometry
+
+def compute_tile(year, lat, lon, tile_start, tile_stop, tile_data, wind_IEC_class, power_curve, in_memory=False, solar_engine='sam', wind_engine='sam', simulate_mask=None, cell_cache=None):
+    # decomposes and simulates a tile read by read_tile, the arguments and outputs are those of simulate_tile
+    tile_lats, tile_lons = get_cell_indices(tile_start, tile_stop, lon.size)
+    (ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection), tile_geometry = tile_data
+
+    wind_classes = np.array([int(wind_IEC_class[longitude][latitude]) for latitude, longitude in zip(tile_lats, tile_lons)])
+
+    # technologies each cell needs (cells that need neither are never put in a tile)
+    solar_needed = np.ones(tile_stop - tile_start, dtype=bool)
+    wind_needed = np.ones(tile_stop - tile_start, dtype=bool)
+    if simulate_mask is not None:
+        solar_needed = simulate_mask[0][tile_start:tile_stop]
+        wind_needed = simulate_mask[1][tile_start:tile_stop]
+
+    # results of unchanged cells come from the result cache, only the rest is simulated
+    solar_outputs = np.zeros(ghi.shape)
+    wind_outputs = np.zeros(ghi.shape)
+    solar_run = solar_needed.copy()
+    wind_run = wind_needed.copy()
+    if cell_cache is not None:
+        with metrics.stage('cache'):
+            solar_keys, wind_keys = get_result_keys(year, lat[tile_lats], lon[tile_lons], tile_data[0], wind_classes, power_curve, in_memory, solar_engine, wind_engine)
+            for outputs, run, keys in [(solar_outputs, solar_run, solar_keys), (wind_outputs, wind_run, wind_keys)]:
+                for cell in np.flatnonzero(run):
+                    cached = cell_cache.get(keys[cell])
+                    if cached is not None:
+                        outputs[cell] = cached
+                        run[cell] = False
+
+    # approximate dni, dhi for the whole tile, unless no cell's solar is simulated
+    dni = dhi = np.zeros(ghi.shape)
+    if solar_run.any():
+        with metrics.stage('decompose'):
+            dni, dhi = get_dni_dhi_batch(year, lat[tile_lats], lon[tile_lons], ghi, tile_geometry) #dirint model
+
+    # batch engines simulate the cells of the tile that need them at once
+    if solar_engine == 'numpy' and solar_run.any():
+        import pvwatts_engine
+        with metrics.stage('solar'):
+            solar_outputs[solar_run] = pvwatts_engine.run_solar_batch(get_annual_date_time_index(year, int(ghi.shape[1] / 24)), lat[tile_lats[solar_run]], lon[tile_lons[solar_run]],
+                dni[solar_run], dhi[solar_run], windSpeed2[solar_run], temperature[solar_run])
+    if wind_engine == 'numpy' and wind_run.any():
+        with metrics.stage('wind'):
+            wind_outputs[wind_run] = run_wp_batch(temperature[wind_run], pressure[wind_run], windSpeed50[wind_run], wind_classes[wind_run], power_curve)
+
+    # the others cell by cell with SAM, only for the technologies the cell needs
+    if solar_engine == 'sam' or wind_engine == 'sam':
+        for cell in range(tile_stop - tile_start):
+            latitude = tile_lats[cell]
+            longitude = tile_lons[cell]
+            cell_solar_engine = solar_engine if solar_run[cell] else 'none'
+            cell_wind_engine = wind_engine if wind_run[cell] else 'none'
+            if cell_solar_engine != 'sam' and cell_wind_engine != 'sam':
+                continue
+
+            solar_cell, wind_cell = simulate_cell(year, lat[latitude], lon[longitude], dni[cell], dhi[cell], temperature[cell], pressure[cell],
+                windSpeed2[cell], windSpeed10[cell], windSpeed50[cell], windDirection[cell], wind_classes[cell], power_curve, in_memory, cell_solar_engine, cell_wind_engine)
+            if cell_solar_engine == 'sam':
+                solar_outputs[cell] = solar_cell
+            if cell_wind_engine == 'sam':
+                wind_outputs[cell] = wind_cell
+
+    # newly simulated results are kept for the next run
+    if cell_cache is not None:
+        with metrics.stage('cache'):
+            for outputs, run, keys in [(solar_outputs, solar_run, solar_keys), (wind_outputs, wind_run, wind_keys)]:
+                for cell in np.flatnonzero(run):
+                    cell_cache.put(keys[cell], outputs[cell])
+
+    # technologies a cell does not need are written as fill values
+    solar_outputs[~solar_needed] = CF_FILL_VALUE
+    wind_outputs[~wind_needed] = CF_FILL_VALUE
+
+    return tile_lats, tile_lons, solar_outputs, wind_outputs
+
+# arrays of a shared resource directory, the outputs of get_tile_data and the solar geometry of every cell
+SHARED_RESOURCE_ARRAYS = ['ghi', 'temperature', 'pressure', 'windSpeed2', 'windSpeed10', 'windSpeed50', 'windDirection', 'zenith', 'cos_zenith']
+
+def get_shared_directory():
+    # memory backed file system where available, files there are kept in memory once however many processes map them
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def get_shared_resource_prefix():
+    # the Slurm job and the process that own a shared resource folder are in its name, so leftovers can be traced and removed
+    return 'powGen_%s_%d_' % (os.environ.get('SLURM_JOB_ID', 'nojob'), os.getpid())
+
+def remove_stale_shared_resources(shared_directory):
+    """ Removes the shared resource folders of powGen processes that no longer run on this node
+
+    A job killed by Slurm (time limit, SIGKILL) never gets to its finally block, and what it left in /dev/shm holds memory until the node reboots
+
+    Args:
+    ----------
+    `shared_directory` (str): folder the shared resources are written to (see get_shared_directory)
+
+    Returns:
+    ----------
+    `removed` (list): names of the folders that were removed
+    """
+    removed = []
+    for name in sorted(os.listdir(shared_directory)):
+        fields = name.split('_')
+        if len(fields) < 4 or fields[0] != 'powGen' or not fields[2].isdigit():
+            continue
+        folder = os.path.join(shared_directory, name)
+        if not os.path.isdir(folder):
+            continue
+        # /dev/shm belongs to the node, so the owner is a process of this node; folders of jobs still running are kept
+        try:
+            os.kill(int(fields[2]), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue
+        shutil.rmtree(folder, ignore_errors=True)
+        removed.append(name)
+    return removed
+
+def create_shared_resource(processed_merra_file, shared_directory, solar_geometry_file=None, tile_size=256, skip=None):
+    """ Writes the resource of the whole region, as get_tile_data returns it, to .npy files that pool workers map instead of reading the processed MERRA file
+
+    ...
+
+    Args:
+    ----------
+    `processed_merra_file` (str): processed MERRA file of the year
+
+    `shared_directory` (str): folder the arrays are written to, best memory backed (see get_shared_directory)
+
+    `solar_geometry_file` (str): solar geometry table of the region, its zenith and cos_zenith are shared as well (None leaves them out)
+
+    `tile_size` (int): cells read from the processed MERRA file at once
+
+    `skip` (np array): cells that are not simulated and not read (a shard's files only take memory for the shard's cells)
+
+    Returns:
+    ----------
+    `resource_directory` (str): new folder with one (cells, hours) array per name of SHARED_RESOURCE_ARRAYS, removed by the caller
+    """
+    removed = remove_stale_shared_resources(shared_directory)
+    if removed:
+        print('Removed shared resources left by stopped runs: %s' % ', '.join(removed), flush=True)
+    resource_directory = tempfile.mkdtemp(prefix=get_shared_resource_prefix() + os.path.basename(processed_merra_file)[:-3] + '_', dir=shared_directory)
+    merra_data = Dataset(processed_merra_file)
+    solar_geometry = Dataset(solar_geometry_file) if solar_geometry_file is not None else None
+    num_cells = merra_data.variables['SWGDN'].shape[0]
+    arrays = dict()
+    try:
+        for tile_start, tile_stop in get_tiles(num_cells, tile_size, skip):
+            resource, tile_geometry = read_tile(merra_data, tile_start, tile_stop, solar_geometry)
+            values = resource + (tile_geometry if tile_geometry is not None else ())
+            for name, tile_values in zip(SHARED_RESOURCE_ARRAYS, values):
+                if name not in arrays:
+                    # dtypes are kept so workers simulate exactly what they would have read themselves
+                    arrays[name] = np.lib.format.open_memmap(os.path.join(resource_directory, name + '.npy'), 'w+', tile_values.dtype, (num_cells, tile_values.shape[1]))
+                arrays[name][tile_start:tile_stop] = tile_values
+        for name in arrays:
+            arrays[name].flush()
+    except BaseException:
+        shutil.rmtree(resource_directory)
+        raise
+    finally:
+        merra_data.close()
+        if solar_geometry is not None:
+            solar_geometry.close()
+    return resource_directory
+
+def open_merra_data(resource_file):
+    # processed MERRA netcdf, or a shared resource directory whose arrays are mapped read only (nothing is read until a tile uses it)
+    if os.path.isdir(resource_file):
+        return {name: np.load(os.path.join(resource_file, name + '.npy'), mmap_mode='r')
+                for name in SHARED_RESOURCE_ARRAYS if os.path.isfile(os.path.join(resource_file, name + '.npy'))}
+    return Dataset(resource_file)
+
+# per process state of pool workers, set once by init_worker (the processed MERRA file is switched when the year changes)
+worker_state = dict()
+
+def init_worker(lat, lon, wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, solar_geometry_file=None, simulate_mask=None, cache_directory=None):
+    # each worker keeps its own handle on the processed MERRA file (and geometry table) and builds its own SAM models,
+    # everything here is the same for every year of the run
+    worker_state['processed_merra_file'] = None
+    worker_state['merra_data'] = None
+    worker_state['solar_geometry'] = Dataset(solar_geometry_file) if solar_geometry_file is not None else None
+    worker_state['lat'] = lat
+    worker_state['lon'] = lon
+    worker_state['wind_IEC_class'] = wind_IEC_class
+    worker_state['power_curve'] = power_curve
+    worker_state['in_memory'] = in_memory
+    worker_state['solar_engine'] = solar_engine
+    worker_state['wind_engine'] = wind_engine
+    worker_state['simulate_mask'] = simulate_mask
+    worker_state['cell_cache'] = result_cache.ResultCache(cache_directory) if cache_directory is not None else None
+
+def run_worker_tile(task):
+    # task is (year, processed MERRA file or shared resource directory, tile), the tile's stage times and the worker's peak memory come back with its outputs
+    year, processed_merra_file, tile = task
+    if worker_state['processed_merra_file'] != processed_merra_file:
+        if isinstance(worker_state['merra_data'], Dataset):
+            worker_state['merra_data'].close()
+        worker_state['merra_data'] = open_merra_data(processed_merra_file)
+        worker_state['processed_merra_file'] = processed_merra_file
+    tile_start, tile_stop = tile
+    tile_outputs = simulate_tile(year, worker_state['merra_data'], worker_state['lat'], worker_state['lon'], tile_start, tile_stop,
+        worker_state['wind_IEC_class'], worker_state['power_curve'], worker_state['in_memory'], worker_state['solar_engine'], worker_state['wind_engine'],
+        worker_state['solar_geometry'], worker_state['simulate_mask'], worker_state['cell_cache'])
+    return (tile,) + tile_outputs + (metrics.pop_stage_times(),)
+
+def read_tiles(tile_pipeline, tile_queue, tiles, merra_data, solar_geometry):
+    # reader thread of the pipelined mode, prefetches the tiles in order until tile_queue is full
+    for tile in tiles:
+        read_times = dict()
+        tile_data = read_tile(merra_data, tile[0], tile[1], solar_geometry, read_times)
+        if not tile_pipeline.put(tile_queue, (tile, tile_data, read_times)):
+            return
+    tile_pipeline.put(tile_queue, pipeline.DONE)
+
+def compute_tiles(tile_pipeline, tile_queue, year, lat, lon, wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, simulate_mask, cell_cache):
+    # simulates the tiles prefetched by read_tiles, yielding them like run_worker_tile
+    while True:
+        item = tile_pipeline.get(tile_queue)
+        if item is pipeline.DONE:
+            return
+        tile, tile_data, read_times = item
+        tile_outputs = compute_tile(year, lat, lon, tile[0], tile[1], tile_data, wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, simulate_mask, cell_cache)
+        tile_metrics = metrics.pop_stage_times()
+        tile_metrics['stages'] = dict(read_times, **tile_metrics['stages'])
+        yield (tile,) + tile_outputs + (tile_metrics,)
+
+def write_tile(cf_writer, metrics_log, tile_result):
+    # write capacity factors for the tile in netcdf
+    tile, tile_lats, tile_lons, solar_outputs, wind_outputs, tile_metrics = tile_result
+    with pipeline.netcdf_lock, metrics.stage('write', tile_metrics['stages']):
+        for cell in range(tile_lats.size):
+            cf_writer.add(tile_lats[cell], tile_lons[cell], solar_outputs[cell], wind_outputs[cell])
+        cf_writer.flush()
+    metrics_log.add_tile(tile[0], tile[1], tile_metrics)
+
+def write_tiles(tile_pipeline, result_queue, cf_writer, metrics_log):
+    # writer thread of the pipelined mode
+    while True:
+        tile_result = tile_pipeline.get(result_queue)
+        if tile_result is pipeline.DONE:
+            return
+        write_tile(cf_writer, metrics_log, tile_result)
+
+def get_tiles(num_cells, tile_size, skip=None):
+    # contiguous ranges of at most tile_size cells, leaving out skipped cells (already finished or in another shard)
+    tiles = []
+    tile_start = None
+    for cell in range(num_cells + 1):
+        done = cell == num_cells or (skip is not None and skip[cell])
+        if tile_start is not None and (done or cell - tile_start == tile_size):
+            tiles.append((tile_start, cell))
+            tile_start = None
+        if tile_start is None and not done:
+            tile_start = cell
+    return tiles
+
+def get_shard(num_cells, num_shards, shard_index):
+    # contiguous range of cells (a band of latitudes) simulated by one task of a job array
+    return shard_index * num_cells // num_shards, (shard_index + 1) * num_cells // num_shards
+
+def get_finished_cells(year, destination, num_lats, num_lons, shard=None, simulate_mask=None, technologies=TECHNOLOGIES):
+    """ Finds cells that already have a complete year of solar and wind capacity factors in the output netcdfs
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the output files
+
+    `destination` (str): folder the files were created in by create_netCDF_files
+
+    `num_lats`, `num_lons` (int): size of the region
+
+    `shard` (tuple): (shard_index, num_shards) to check the partial files of one shard, None for the full files
+
+    `simulate_mask` (tuple): (solar_needed, wind_needed) of a sparse run, a technology a cell does not need stays at the fill value
+    and does not keep the cell from being finished
+
+    `technologies` (list): technologies of the run, the files of the others are not checked
+
+    Returns:
+    ----------
+    `finished` (np array): True for each cell (in processed vector order) whose every hour was written to the files,
+    cells with any hour still at the fill value (never or partly written) are False
+
+    """
+    finished = np.ones((num_lats, num_lons), dtype=bool)
+    for index, technology in enumerate(TECHNOLOGIES):
+        if technology not in technologies:
+            continue
+        not_needed = np.zeros((num_lats, num_lons), dtype=bool) if simulate_mask is None else ~simulate_mask[index].reshape(num_lats, num_lons)
+        data = Dataset(get_cf_file_name(year, technology, destination, shard))
+        cf = data.variables['cf']
+        for latitude in range(num_lats):
+            # one latitude row at a time to keep memory bounded
+            finished[latitude] &= ~np.ma.getmaskarray(cf[latitude, :, :]).any(axis=1) | not_needed[latitude]
+        data.close()
+    return finished.reshape(num_lats * num_lons)
+
+def get_simulate_mask(wind_IEC_class, num_lats, num_lons, skip_unsuitable_wind=True, region_mask_file=None, offshore_mask_file=None):
+    """ Finds which cells need solar and which need wind for a sparse run, everything else is written as fill values
+
+    ...
+
+    Args:
+    ----------
+    `wind_IEC_class` (DataFrame): IEC wind class of each cell (0 is not suitable for wind)
+
+    `num_lats`, `num_lons` (int): size of the region
+
+    `skip_unsuitable_wind` (bool): leave out wind in cells of IEC class 0
+
+    `region_mask_file` (str): MERRA format bounds (e.g. state_MERRA_Format_Bounds.xlsx from generate_boundaries), cells with 0 are
+    outside the region and left out for both technologies
+
+    `offshore_mask_file` (str): MERRA format offshore bounds (offshore_MERRA_Format_Bounds.xlsx), solar is left out in offshore cells
+
+    Returns:
+    ----------
+    `solar_needed`, `wind_needed` (np array): True for cells (in processed vector order) where the technology is simulated
+
+    """
+    # spreadsheets have a row per latitude and a column per longitude, like the IEC class map
+    def read_mask(mask_file):
+        mask = asset_cache.read_excel_cached(mask_file, index_col=0).values
+        if mask.shape != (num_lats, num_lons):
+            raise ValueError('%s has shape %s, expected (%d, %d)' % (mask_file, mask.shape, num_lats, num_lons))
+        # state bounds add up one raster per state, cells on a border of two states are 2 (empty cells read as nan are outside)
+        return mask.reshape(num_lats * num_lons) > 0
+
+    in_region = np.ones(num_lats * num_lons, dtype=bool)
+    if region_mask_file is not None:
+        in_region = read_mask(region_mask_file)
+    offshore = np.zeros(num_lats * num_lons, dtype=bool)
+    if offshore_mask_file is not None:
+        offshore = read_mask(offshore_mask_file)
+
+    solar_needed = in_region & ~offshore
+    wind_needed = in_region.copy()
+    if skip_unsuitable_wind:
+        wind_needed &= np.asarray(wind_IEC_class.values, dtype=int).reshape(num_lats * num_lons) != 0
+    return solar_needed, wind_needed
+
+def merge_shards(year, lats, lons, destination, num_shards, chunk_shape=None, complevel=0, simulate_mask=None, quantize=False, technologies=TECHNOLOGIES):
+    """ Assembles the partial outputs of every shard of a job array into the final solar and wind capacity factor files
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the output files
+
+    `lats`, `lons` (np array): latitudes and longitudes of the region
+
+    `destination` (str): folder of the partial files, the final files are written there too
+
+    `num_shards` (int): number of shards the region was split into
+
+    `chunk_shape`, `complevel`, `quantize`: storage of the final files (see create_netCDF_files)
+
+    `simulate_mask` (tuple): (solar_needed, wind_needed) if the shards were a sparse run
+
+    `technologies` (list): technologies the shards simulated, only their final files are written
+
+    """
+    num_cells = lats.size * lons.size
+
+    # every shard must have finished all of its cells before anything is merged
+    incomplete = []
+    for shard_index in range(num_shards):
+        shard = (shard_index, num_shards)
+        shard_start, shard_stop = get_shard(num_cells, num_shards, shard_index)
+        if not all(os.path.isfile(get_cf_file_name(year, technology, destination, shard)) for technology in technologies):
+            incomplete.append(shard_index)
+        elif not get_finished_cells(year, destination, lats.size, lons.size, shard, simulate_mask, technologies)[shard_start:shard_stop].all():
+            incomplete.append(shard_index)
+    if len(incomplete) > 0:
+        error_message = 'Shards %s of %d are not finished, rerun them (with --resume) before merging' % (incomplete, num_shards)
+        raise RuntimeError(error_message)
+
+    create_netCDF_files(year, lats, lons, destination, chunk_shape, complevel, quantize=quantize, technologies=technologies)
+    cf_writer = CFWriter(year, destination, technologies=technologies)
+    for shard_index in range(num_shards):
+        shard = (shard_index, num_shards)
+        shard_start, shard_stop = get_shard(num_cells, num_shards, shard_index)
+        if shard_start == shard_stop:
+            continue
+        first_lat = shard_start // lons.size
+        last_lat = (shard_stop - 1) // lons.size
+        shard_cf = dict()
+        for technology in TECHNOLOGIES:
+            # technologies the shards did not simulate are dropped by cf_writer
+            shard_cf[technology] = None
+            if technology in technologies:
+                data = Dataset(get_cf_file_name(year, technology, destination, shard))
+                shard_cf[technology] = np.ma.filled(data.variables['cf'][first_lat:last_lat + 1, :, :], CF_FILL_VALUE)
+                data.close()
+        solar_cf, wind_cf = shard_cf["solar"], shard_cf["wind"]
+        shard_lats, shard_lons = get_cell_indices(shard_start, shard_stop, lons.size)
+        for cell in range(shard_stop - shard_start):
+            row, column = shard_lats[cell] - first_lat, shard_lons[cell]
+            cf_writer.add(shard_lats[cell], shard_lons[cell], solar_cf[row, column] if solar_cf is not None else None, wind_cf[row, column] if wind_cf is not None else None)
+        cf_writer.flush()
+        print('Merged shard %d of %d' % (shard_index, num_shards), flush=True)
+    cf_writer.close()
+
+def get_processed_merra_file(processed_merra_path, region, year):
     if region == "wecc": processed_merra_name = 'cordDataWestCoastYear' + str(year) + '.nc'
     else: processed_merra_name = 'processedMERRA' + region+str(year)+'.nc'
-    processed_merra_file = processed_merra_path + processed_merra_name
+    return processed_merra_path + processed_merra_name
+
+def simulate_year(year, processed_merra_file, destination_file_path, lat, lon, wind_IEC_class, power_curve, pool=None, solar_geometry_file=None,
+    in_memory=False, tile_size=256, chunk_shape=None, complevel=0, resume=False, shard=None, cell_range=None, solar_engine='sam', wind_engine='sam',
+    metrics_file=None, summary_interval=60., run_info=None, simulate_mask=None, quantize=False, pipeline_depths=None, shared_directory=None,
+    technologies=TECHNOLOGIES, cache_directory=None):
+    """ Simulates the capacity factors of one year of a region (or of one shard of it) and writes them to that year's output files
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year to simulate
+
+    `processed_merra_file` (str): processed MERRA file of the year
+
+    `destination_file_path` (str): folder of the capacity factor files
+
+    `lat`, `lon` (np array): latitudes and longitudes of the region
+
+    `wind_IEC_class` (DataFrame), `power_curve` (dict): static wind inputs, loaded once for every year of a run
+
+    `pool` (Pool): worker processes started by main (with init_worker), None simulates the tiles in this process
+
+    `solar_geometry_file` (str): solar geometry table of the region, None computes the sun position of every tile
+
+    `shard` (tuple): (shard_index, num_shards) of a job array task, None for the whole region
+
+    `simulate_mask` (tuple): (solar_needed, wind_needed) from get_simulate_mask for a sparse run, None simulates every cell
+
+    `pipeline_depths` (tuple): (read, write) queue depths of the pipelined mode, tiles read ahead by a reader thread (without a pool)
+    and simulated tiles waiting for the writer thread, None reads, simulates and writes one tile after another
+
+    `shared_directory` (str): with a pool, folder the region's resource is written to once for all workers (see create_shared_resource),
+    None lets every worker read its tiles from the processed MERRA file
+
+    `technologies` (list): technologies simulated and written, the files of the others are left as they are (their cells must be
+    left out by simulate_mask)
+
+    `cache_directory` (str): result cache of the region (see result_cache.ResultCache), None simulates every cell
+
+    The remaining arguments are those of main.
+
+    """
+    #cells outside this task's shard of a job array are skipped
+    num_cells = lat.size * lon.size
+    skip = np.zeros(num_cells, dtype=bool)
+    if shard is not None:
+        shard_start, shard_stop = get_shard(num_cells, shard[1], shard[0])
+        skip[:shard_start] = True
+        skip[shard_stop:] = True
+        if chunk_shape is None:
+            # chunked by latitude row so rows of other shards are never allocated in the partial files
+            chunk_shape = (1, lon.size, 8760)
+
+    #only simulate cells start:stop of the processed vector (profiling a single cell or tile)
+    if cell_range is not None:
+        skip[:cell_range[0]] = True
+        skip[cell_range[1]:] = True
+
+    #cells that need neither technology in a sparse run stay at the fill value
+    if simulate_mask is not None:
+        skip |= ~(simulate_mask[0] | simulate_mask[1])
+
+    #set_up net CDFs, or pick up where an interrupted run left off
+    if resume and all(os.path.isfile(get_cf_file_name(year, technology, destination_file_path, shard)) for technology in technologies):
+        finished = get_finished_cells(year, destination_file_path, lat.size, lon.size, shard, simulate_mask, technologies)
+        print('Resuming: %d of %d cells already finished' % ((finished & ~skip).sum(), (~skip).sum()), flush=True)
+        skip |= finished
+    else:
+        create_netCDF_files(year, lat, lon, destination_file_path, chunk_shape, complevel, shard, quantize, technologies)
+    cf_writer = CFWriter(year, destination_file_path, shard, technologies)
+    cell_cache = result_cache.ResultCache(cache_directory) if cache_directory is not None else None
+
+    #stage times, peak memory and progress of the year
+    run_info = dict(run_info or {}, year=year, shard=shard)
+    metrics_log = metrics.MetricsLog(int((~skip).sum()), metrics_file, summary_interval, run_info)
+
+    #simulate power generation for every latitude and longitude, reading the resource one tile of cells at a time
+    tiles = get_tiles(num_cells, tile_size, skip)
+    tile_pipeline = pipeline.Pipeline() if pipeline_depths is not None else None
+    shared_resource_directory = None
+    if pool is not None:
+        if shared_directory is not None:
+            # the region's resource is read once into arrays every worker maps, instead of each worker reading and holding its own tiles
+            shared_resource_directory = create_shared_resource(processed_merra_file, shared_directory, solar_geometry_file, tile_size, skip)
+        # tiles are spread over worker processes, results come back here to a single writer
+        tile_results = pool.imap_unordered(run_worker_tile, [(year, shared_resource_directory or processed_merra_file, tile) for tile in tiles])
+    else:
+        merra_data = Dataset(processed_merra_file)
+        solar_geometry = Dataset(solar_geometry_file) if solar_geometry_file is not None else None
+        if tile_pipeline is None:
+            tile_results = ((tile,) + simulate_tile(year, merra_data, lat, lon, tile[0], tile[1], wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, solar_geometry,
+                simulate_mask, cell_cache) + (metrics.pop_stage_times(),) for tile in tiles)
+        else:
+            # a reader thread prefetches the next tiles while this thread simulates
+            tile_queue = queue.Queue(pipeline_depths[0])
+            tile_pipeline.start(read_tiles, tile_pipeline, tile_queue, tiles, merra_data, solar_geometry)
+            tile_results = compute_tiles(tile_pipeline, tile_queue, year, lat, lon, wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, simulate_mask, cell_cache)
+
+    try:
+        if tile_pipeline is None:
+            for tile_result in tile_results:
+                write_tile(cf_writer, metrics_log, tile_result)
+        else:
+            # and a writer thread writes the finished tiles, at most pipeline_depths[1] simulated tiles wait for it
+            result_queue = queue.Queue(pipeline_depths[1])
+            tile_pipeline.start(write_tiles, tile_pipeline, result_queue, cf_writer, metrics_log)
+            try:
+                for tile_result in tile_results:
+                    if not tile_pipeline.put(result_queue, tile_result):
+                        break
+                tile_pipeline.put(result_queue, pipeline.DONE)
+            except BaseException as error:
+                tile_pipeline.join(error)
+                raise
+            tile_pipeline.join()
+    finally:
+        if shared_resource_directory is not None:
+            shutil.rmtree(shared_resource_directory)
+        # also when the run stops early, closing writes the buffered cells and syncs the files for --resume
+        cf_writer.close()
+
+    if pool is None:
+        merra_data.close()
+        if solar_geometry is not None:
+            solar_geometry.close()
+    metrics_log.close()
+
+def stop_on_sigterm(signum, frame):
+    # slurm sends SIGTERM some time before it kills a job at its time limit or when it is preempted, stopping with an exception
+    # runs the finally blocks of simulate_year that close the output files and remove the shared resource
+    raise SystemExit('Stopped by signal %d, resubmit with --resume to continue' % signum)
+
+def main(year,region,in_memory=False,tile_size=256,chunk_shape=None,complevel=0,workers=1,resume=False,num_shards=1,shard_index=None,merge=False,solar_engine='sam',wind_engine='sam',cell_range=None,metrics_file=None,summary_interval=60.,use_geometry_cache=True,end_year=None,sparse=False,region_mask_file=None,offshore_mask_file=None,layout='default',quantize=False,pipeline_depths=None,shared_resource=False,shared_directory=None,technologies=TECHNOLOGIES,result_cache_directory=None):
+    # years year..end_year are simulated one after another in this process, each still gets its own output files
+    years = list(range(year, (end_year if end_year is not None else year) + 1))
+
+    print('Begin Program: \t {:%Y-%m-%d %H:%M:%S}'.format(datetime.datetime.now()))
+
+    root_directory = '/scratch/mtcraig_root/mtcraig1/shared_data/'
+
+    processed_merra_path = root_directory + 'merraData/resource/' + region + '/processed/'
+    processed_merra_files = [get_processed_merra_file(processed_merra_path, region, run_year) for run_year in years]
     destination_file_path = root_directory + 'merraData/cfs/'+region+'/'
 
-    #get latitude and longitude arrays
-    lat, lon = get_lat_lon(processed_merra_file)
+    #get latitude and longitude arrays, every year of a region is on the same grid
+    lat, lon = get_lat_lon(processed_merra_files[0])
+
+    shard = (shard_index, num_shards) if shard_index is not None else None
+
+    #results of single cells are reused across runs from the region's cache folder by default
+    if result_cache_directory == '':
+        result_cache_directory = destination_file_path + 'cache/'
 
-    #set_up net CDFs
-    create_netCDF_files(year, lat, lon, destination_file_path)
+    #runs of part of the grid (--cell-range, e.g. profiling a cell) write to their own folder so they never recreate the region's outputs
+    if cell_range is not None:
+        destination_file_path += 'cell_range/'
+        os.makedirs(destination_file_path, exist_ok=True)
+
+    #workers map the resource of the region from memory backed files by default
+    if shared_resource and shared_directory is None:
+        shared_directory = get_shared_directory()
+
+    #a queue depth of 0 would make the queues of the pipelined mode unbounded
+    if pipeline_depths is not None and min(pipeline_depths) < 1:
+        raise ValueError('queue depths of the pipeline must be at least 1, got %s' % (pipeline_depths,))
+
+    #storage of the final cf files, an explicit chunk shape wins over the layout
+    #(partial files of shards keep their latitude row chunks unless a chunk shape is given)
+    output_chunk_shape = chunk_shape if chunk_shape is not None else get_chunk_shape(layout, lat.size, lon.size)
+    year_chunk_shape = chunk_shape if shard is not None else output_chunk_shape
 
     #get power curve for wind
     power_curve_file = root_directory + 'powGen/wind_turbine_power_curves.xlsx'
@@ -301,43 +1610,59 @@ def main(year,region):
 
     #check for IEC class
     excelFilePath = root_directory + 'powGen/IEC_wind_class_'+region+'.xlsx'
-    wind_IEC_class = pd.read_excel(excelFilePath,index_col=0)
-
-    #simulate power generation for every latitude and longitude
-    for longitude in range(lon.size):
-        for latitude in range(lat.size):
-
-            solar_csv = create_csv(year, lat[latitude], lon[longitude])
-            wind_srw = create_srw(year, lat[latitude], lon[longitude])
-            
-            merra_data = Dataset(processed_merra_file)
-            ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = get_data(latitude, longitude, lon.size, merra_data)
-            merra_data.close()
-            
-            # write wind resource data to srw for SAM
-            write_2srw(wind_srw, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection)
+    wind_IEC_class = asset_cache.read_excel_cached(excelFilePath,index_col=0)
 
-            # approximate dni, dhi, then write solar resource data to csv for SAM
-            for jd in range(int(ghi.size / 24)):
-                month, day = get_date(jd + 1)
-                dni, dhi = get_dni_dhi(year, jd + 1, month, day, lat[latitude], lon[longitude], ghi[(jd)*24:(jd+1)*24]) #disc model
-                write_day2csv(solar_csv, year, month, day, dni, dhi, windSpeed2[(jd)*24:(jd+1)*24], temperature[(jd)*24:(jd+1)*24])
-            
-            # simulate generation with System Advisory Model
-            solar_outputs = run_solar(solar_csv, lat[latitude])
-            wind_outputs = run_wp(wind_srw,int(wind_IEC_class[longitude][latitude]), power_curve)
+    #cells and technologies to simulate in a sparse run (IEC class 0 has no wind, cells outside the region mask nothing)
+    simulate_mask = None
+    if sparse:
+        simulate_mask = get_simulate_mask(wind_IEC_class, lat.size, lon.size, True, region_mask_file, offshore_mask_file)
+        print('Sparse run: solar in %d, wind in %d of %d cells' % (simulate_mask[0].sum(), simulate_mask[1].sum(), lat.size * lon.size), flush=True)
 
-            # remove resource data (save space)
-            os.remove(solar_csv)
-            os.remove(wind_srw)
+    #solar-only and wind-only runs leave the other technology out of every cell and its output files as they are
+    if set(technologies) != set(TECHNOLOGIES):
+        solar_needed, wind_needed = simulate_mask if simulate_mask is not None else (np.ones(lat.size * lon.size, dtype=bool), np.ones(lat.size * lon.size, dtype=bool))
+        simulate_mask = (solar_needed & ("solar" in technologies), wind_needed & ("wind" in technologies))
+    technologies = [technology for technology in TECHNOLOGIES if technology in technologies]
 
-            # write capacity factors for coordinate in netcdf
-            write_cord(year, solar_outputs, wind_outputs, latitude, longitude, destination_file_path)
+    #assemble the outputs of a job array once all of its shards are done
+    if merge:
+        for run_year in years:
+            merge_shards(run_year, lat, lon, destination_file_path, num_shards, output_chunk_shape, complevel, simulate_mask, quantize, technologies)
+        return
 
-            # status update
-            print("%f, " %lat[latitude], "%f\t" %lon[longitude], '{:%Y-%m-%d %H:%M:%S} \n'.format(datetime.datetime.now()))
-        print('Longitude finished: \t {:%Y-%m-%d %H:%M:%S} \n'.format(datetime.datetime.now()))
+    #sun position of every cell, the same for every year of the region
+    solar_geometry_file = None
+    if use_geometry_cache:
+        merra_data = Dataset(processed_merra_files[0])
+        num_days = merra_data.variables['SWGDN'].shape[1]
+        merra_data.close()
+        solar_geometry_file = get_solar_geometry_file(processed_merra_path, region, lat, lon, num_days)
 
-if __name__ == "__main__":
-    main(year,region)
+    #a job stopped by slurm closes its output files before it ends (handlers can only be set from the main thread)
+    if multiprocessing.current_process().name == 'MainProcess' and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop_on_sigterm)
 
+    # worker processes are started once and keep their SAM models and static inputs for every year
+    # (spawned rather than forked so workers don't inherit the open output netcdfs)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=init_worker, initargs=(lat, lon, wind_IEC_class, power_curve, in_memory, solar_engine, wind_engine, solar_geometry_file, simulate_mask, result_cache_directory))
+
+    run_info = {'region': region, 'workers': workers, 'tile_size': tile_size, 'in_memory': in_memory, 'solar_engine': solar_engine, 'wind_engine': wind_engine, 'pipeline_depths': pipeline_depths, 'shared_resource': shared_resource,
+        'technologies': technologies, 'result_cache': result_cache_directory}
+    for run_year, processed_merra_file in zip(years, processed_merra_files):
+        if len(years) > 1:
+            print('Year: ' + str(run_year), flush=True)
+        year_lat, year_lon = get_lat_lon(processed_merra_file)
+        if not (np.array_equal(year_lat, lat) and np.array_equal(year_lon, lon)):
+            raise ValueError(processed_merra_file + ' is not on the same grid as ' + processed_merra_files[0])
+        simulate_year(run_year, processed_merra_file, destination_file_path, lat, lon, wind_IEC_class, power_curve, pool, solar_geometry_file,
+            in_memory, tile_size, year_chunk_shape, complevel, resume, shard, cell_range, solar_engine, wind_engine, metrics_file, summary_interval, run_info, simulate_mask,
+            quantize, pipeline_depths, shared_directory if shared_resource else None, technologies, result_cache_directory)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+if __name__ == "__main__":
+    main(year,region,args.in_memory,args.tile_size,args.chunk_shape,args.complevel,args.workers,args.resume,args.shards,args.shard_index,args.merge,args.solar_engine,args.wind_engine,args.cell_range,args.metrics,args.summary_interval,not args.no_geometry_cache,args.end_year,args.sparse,args.region_mask,args.offshore_mask,args.layout,args.quantize,tuple(args.queue_depths) if args.pipeline else None,args.shared_resource,args.shared_directory,args.technologies,args.result_cache)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#vectorized equivalent of the PVWatts v7 simulation done by run_solar in powGen_impl_beta, for many cells at once
+#every function works on arrays of shape (cells, hours), the hourly time index is shared by all cells
+
+import numpy as np
+import pvlib
+import pvlib.spa as spa
+
+#PVWatts v7 inputs that run_solar leaves at their defaults
+GCR = 0.4 #ground coverage ratio of the rows
+ALBEDO = 0.2
+ELEVATION = 500 #m, written in the resource header by create_csv
+PRESSURE = 1013.25 #mbar, the resource has no pressure column
+DELTA_T = 67.0 #s
+NOCT = 45 #C, standard module in an open rack
+GAMMA = -0.0037 #1/C, power temperature coefficient of the standard module
+
+def get_time_terms(times, delta_t=DELTA_T):
+    # location independent part of the solar position algorithm, at the start and end of every hour
+    unixtime = np.asarray(times.astype('int64') / 1e9, dtype=float)
+    bounds = np.concatenate([unixtime, unixtime + 3600])
+    v, alpha, delta = spa.solar_position_numpy(bounds, 0, 0, 0, 0, 0, delta_t, 0, 1, sst=True)
+    R = spa.solar_position_numpy(bounds, 0, 0, 0, 0, 0, delta_t, 0, 1, esd=True)[0]
+
+    hour_start = dict(v=v[:unixtime.size], alpha=alpha[:unixtime.size], delta=delta[:unixtime.size], R=R[:unixtime.size])
+    # change over the hour, angles are wrapped so the change is never a full turn
+    hour_change = dict(v=(v[unixtime.size:] - v[:unixtime.size] + 180) % 360 - 180,
+                       alpha=(alpha[unixtime.size:] - alpha[:unixtime.size] + 180) % 360 - 180,
+                       delta=delta[unixtime.size:] - delta[:unixtime.size],
+                       R=R[unixtime.size:] - R[:unixtime.size])
+    return hour_start, hour_change
+
+def get_sun_rise_set(times, latitudes, longitudes, delta_t=DELTA_T):
+    """ Sunrise and sunset of every day and cell, as pvlib.spa.transit_sunrise_sunset for many locations at once
+
+    ...
+
+    Args:
+    ----------
+    `times` (DatetimeIndex): hourly time index (UTC), 24 hours per day
+
+    `latitudes`, `longitudes` (np array): location of each cell in degrees
+
+    `delta_t` (float): difference between terrestrial time and UT (s)
+
+    Returns:
+    ----------
+    `sunrise`, `sunset` (np array): hours after midnight UTC of each day, shape (cells, days), nan if the sun doesn't rise or set
+
+    """
+    lat = np.asarray(latitudes, dtype=float).reshape(-1, 1)
+    lon = np.asarray(longitudes, dtype=float).reshape(-1, 1)
+
+    utday = np.asarray(times[::24].normalize().astype('int64') / 1e9, dtype=float)
+    ttday0 = utday - delta_t
+    v = spa.solar_position_numpy(utday, 0, 0, 0, 0, 0, delta_t, 0, 1, sst=True)[0]
+    _, alpha0, delta0 = spa.solar_position_numpy(ttday0, 0, 0, 0, 0, 0, delta_t, 0, 1, sst=True)
+    _, alphan1, deltan1 = spa.solar_position_numpy(ttday0 - 86400, 0, 0, 0, 0, 0, delta_t, 0, 1, sst=True)
+    _, alphap1, deltap1 = spa.solar_position_numpy(ttday0 + 86400, 0, 0, 0, 0, 0, delta_t, 0, 1, sst=True)
+
+    m0 = (alpha0 - lon - v) / 360
+    cos_arg = (np.sin(np.radians(-0.8333)) - np.sin(np.radians(lat)) * np.sin(np.radians(delta0))) / (np.cos(np.radians(lat)) * np.cos(np.radians(delta0)))
+    cos_arg = np.where(np.abs(cos_arg) > 1, np.nan, cos_arg)
+    H0 = np.degrees(np.arccos(cos_arg)) % 180
+
+    m_transit = m0 % 1
+    m_rise = m_transit - H0 / 360
+    m_set = m_transit + H0 / 360
+    add_a_day = m_set >= 1
+    sub_a_day = m_rise < 0
+    m_rise = m_rise % 1
+    m_set = m_set % 1
+
+    def wrap(x):
+        return np.where(np.abs(x) > 2, x % 1, x)
+    a = wrap(alpha0 - alphan1)
+    ap = wrap(delta0 - deltan1)
+    b = wrap(alphap1 - alpha0)
+    bp = wrap(deltap1 - delta0)
+    c = b - a
+    cp = bp - ap
+
+    def event(m):
+        vs = v + 360.985647 * m
+        n = m + delta_t / 86400
+        alpha_prime = alpha0 + (n * (a + b + c * n)) / 2
+        delta_prime = delta0 + (n * (ap + bp + cp * n)) / 2
+        Hp = (vs + lon - alpha_prime) % 360
+        Hp = np.where(Hp >= 180, Hp - 360, Hp)
+        h = np.degrees(np.arcsin(np.sin(np.radians(lat)) * np.sin(np.radians(delta_prime)) + np.cos(np.radians(lat)) * np.cos(np.radians(delta_prime)) * np.cos(np.radians(Hp))))
+        return (m + (h + 0.8333) / (360 * np.cos(np.radians(delta_prime)) * np.cos(np.radians(lat)) * np.sin(np.radians(Hp)))) * 24
+
+    sunrise = event(m_rise) - 24 * sub_a_day
+    sunset = event(m_set) + 24 * add_a_day
+    return sunrise, sunset
+
+def get_solar_position(times, latitudes, longitudes, temperature, delta_t=DELTA_T):
+    """ Sun position the way SAM takes it for hourly weather files without a minute column
+
+    The sun is placed at the middle of the hour, or at the middle of the part of the hour the sun is up for hours with sunrise or sunset
+    (rounded down to the whole minute as in SAM), using the NREL solar position algorithm.
+
+    ...
+
+    Args:
+    ----------
+    `times` (DatetimeIndex): hourly time index (UTC), 24 hours per day
+
+    `latitudes`, `longitudes` (np array): location of each cell in degrees
+
+    `temperature` (np array): hourly temperature (C) used for refraction, shape (cells, hours)
+
+    `delta_t` (float): difference between terrestrial time and UT (s)
+
+    Returns:
+    ----------
+    `zenith`, `azimuth` (np array): apparent solar zenith and azimuth (degrees), shape (cells, hours)
+
+    `sunup` (np array): True for hours the sun is up for at least part of the hour
+
+    """
+    lat = np.asarray(latitudes, dtype=float).reshape(-1, 1)
+    lon = np.asarray(longitudes, dtype=float).reshape(-1, 1)
+    hours = np.asarray(times.hour, dtype=float)
+    days = np.arange(hours.size) // 24
+
+    sunrise, sunset = get_sun_rise_set(times, latitudes, longitudes, delta_t)
+    sunrise = sunrise[:, days] % 24
+    sunset = sunset[:, days] % 24
+
+    # fraction of the hour the sun position is taken at
+    rise_hour = (hours <= sunrise) & (sunrise < hours + 1)
+    set_hour = (hours <= sunset) & (sunset < hours + 1) & ~rise_hour
+    fraction = np.full(sunrise.shape, 0.5)
+    fraction = np.where(rise_hour, np.floor(((sunrise + hours + 1) / 2 - hours) * 60) / 60, fraction)
+    fraction = np.where(set_hour, np.floor(((hours + sunset) / 2 - hours) * 60) / 60, fraction)
+
+    # sunset can fall on the next day in UTC
+    sunup = np.where(sunrise < sunset, (hours + 0.5 > sunrise) & (hours + 0.5 < sunset), (hours + 0.5 > sunrise) | (hours + 0.5 < sunset))
+    sunup = sunup | rise_hour | set_hour
+
+    hour_start, hour_change = get_time_terms(times, delta_t)
+    v, alpha, delta, R = [hour_start[term] + fraction * hour_change[term] for term in ['v', 'alpha', 'delta', 'R']]
+
+    H = spa.local_hour_angle(v, lon, alpha)
+    xi = spa.equatorial_horizontal_parallax(R)
+    u = spa.uterm(lat)
+    x = spa.xterm(u, lat, ELEVATION)
+    y = spa.yterm(u, lat, ELEVATION)
+    delta_alpha = spa.parallax_sun_right_ascension(x, xi, H, delta)
+    delta_prime = spa.topocentric_sun_declination(delta, x, y, xi, delta_alpha, H)
+    H_prime = spa.topocentric_local_hour_angle(H, delta_alpha)
+    e0 = spa.topocentric_elevation_angle_without_atmosphere(lat, delta_prime, H_prime)
+    delta_e = spa.atmospheric_refraction_correction(PRESSURE, temperature, e0, 0.5667)
+    zenith = spa.topocentric_zenith_angle(e0 + delta_e)
+    azimuth = spa.topocentric_azimuth_angle(spa.topocentric_astronomers_azimuth(H_prime, delta_prime, lat))
+
+    return zenith, azimuth, sunup
+
+def get_shading_view_factors(tilt, gcr=GCR, steps=1000):
+    # sky and ground view of a module in the middle of the array, relative to a module without neighbouring rows,
+    # averaged over the height of the module
+    tilt_rads = np.radians(np.asarray(tilt, dtype=float)).reshape(-1, 1)
+    row_pitch = 1 / gcr
+    position = (np.arange(steps) + 0.5) / steps
+
+    sky_angle = np.arctan(np.sin(tilt_rads) * (1 - position) / (row_pitch - (1 - position) * np.cos(tilt_rads)))
+    sky_view = ((1 + np.cos(tilt_rads + sky_angle)) / 2).mean(axis=1) / ((1 + np.cos(tilt_rads[:, 0])) / 2)
+
+    ground_angle = np.arctan(position * np.sin(tilt_rads) / (row_pitch + position * np.cos(tilt_rads)))
+    ground_view = ((1 - np.cos(tilt_rads - ground_angle)) / 2).mean(axis=1) / ((1 - np.cos(tilt_rads[:, 0])) / 2)
+
+    return sky_view.reshape(-1, 1), ground_view.reshape(-1, 1)
+
+def get_cover_transmittance(theta, ar_glass=True):
+    # glass cover transmittance at incidence angle theta (degrees) relative to normal incidence,
+    # physical model (Fresnel reflection and absorption) with an anti-reflective coating as in SAM
+    def transmittance(theta1, n_cover, n_incoming, k, thickness):
+        theta2 = np.arcsin(n_incoming / n_cover * np.sin(theta1))
+        reflected = 0.5 * (np.sin(theta2 - theta1) ** 2 / np.sin(theta2 + theta1) ** 2 + np.tan(theta2 - theta1) ** 2 / np.tan(theta2 + theta1) ** 2)
+        return (1 - reflected) * np.exp(-k * thickness / np.cos(theta2)), theta2
+
+    def unnormalized(theta):
+        theta1 = np.radians(theta)
+        if ar_glass:
+            tau_coating, theta2 = transmittance(theta1, 1.3, 1.0, 4, 0.002 * 0.01)
+            tau_glass, _ = transmittance(theta2, 1.526, 1.3, 4, 0.002)
+            return tau_coating * tau_glass
+        return transmittance(theta1, 1.526, 1.0, 4, 0.002)[0]
+
+    theta = np.clip(theta, 0.5, 89.5)
+    return unnormalized(theta) / unnormalized(1.0)
+
+def get_poa_batch(times, tilt, dni, dhi, zenith, azimuth, sunup, gcr=GCR, albedo=ALBEDO):
+    """ Plane of array irradiance of fixed south facing rows, before and after the module cover
+
+    Perez sky diffuse model (isotropic beyond 87.5 degrees zenith, as SAM), with the reduced sky and ground view and
+    the row to row beam shading of PVWatts v7 self-shading for fixed racks.
+
+    ...
+
+    Args:
+    ----------
+    `times` (DatetimeIndex): hourly time index (UTC)
+
+    `tilt` (np array): tilt of each cell's array (degrees)
+
+    `dni`, `dhi` (np array): hourly direct normal and diffuse horizontal irradiance, shape (cells, hours)
+
+    `zenith`, `azimuth`, `sunup` (np array): sun position from get_solar_position
+
+    `gcr` (float): ground coverage ratio of the rows
+
+    `albedo` (float): ground reflectance
+
+    Returns:
+    ----------
+    `poa` (np array): plane of array irradiance (W/m2)
+
+    `tpoa` (np array): irradiance transmitted through the cover (W/m2)
+
+    """
+    tilt = np.asarray(tilt, dtype=float).reshape(-1, 1)
+    tilt_rads = np.radians(tilt)
+    zenith_rads = np.radians(zenith)
+
+    cos_aoi = np.cos(zenith_rads) * np.cos(tilt_rads) + np.sin(zenith_rads) * np.sin(tilt_rads) * np.cos(np.radians(azimuth - 180))
+    aoi = np.degrees(np.arccos(np.clip(cos_aoi, -1, 1)))
+    ghi = np.maximum(dni * np.cos(zenith_rads) + dhi, 0)
+
+    # sky diffuse
+    dni_extra = pvlib.irradiance.get_extra_radiation(np.asarray(times.dayofyear)).reshape(1, -1)
+    airmass = pvlib.atmosphere.get_relative_airmass(zenith, 'kasten1966')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sky = pvlib.irradiance.perez(tilt, 180, dhi, dni, dni_extra, zenith, azimuth, airmass)
+    sky = np.where(zenith > 87.5, dhi * (1 + np.cos(tilt_rads)) / 2, np.nan_to_num(sky))
+
+    # self-shading of the rows: the row in front shades the bottom of the module (profile angle of the sun perpendicular to the rows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profile = np.arctan2(np.tan(np.pi / 2 - zenith_rads), np.cos(np.radians(azimuth - 180)))
+        profile = np.where(profile < 0, profile + np.pi, profile)
+        shaded = np.clip(1 - np.sin(profile) / (gcr * np.sin(profile + tilt_rads)), 0, 1)
+        ground_shaded = np.clip((np.cos(tilt_rads) + np.sin(tilt_rads) / np.tan(profile)) * gcr, 0, 1)
+    sky_view, ground_view = get_shading_view_factors(tilt, gcr)
+
+    beam = np.maximum(dni * cos_aoi, 0) * (1 - shaded)
+    poa_sky = sky * sky_view
+    ground_factor = ground_view * np.where(ghi > 0, ((1 - ground_shaded) * ghi + ground_shaded * dhi) / np.where(ghi > 0, ghi, 1), 1)
+    poa_ground = ghi * albedo * (1 - np.cos(tilt_rads)) / 2 * ground_factor
+
+    # cover losses, diffuse at the effective incidence angles of Brandemuehl and Beckman
+    theta_sky = 59.7 - 0.1388 * tilt + 0.001497 * tilt ** 2
+    theta_ground = 90 - 0.5788 * tilt + 0.002693 * tilt ** 2
+    poa = np.where(sunup, beam + poa_sky + poa_ground, 0)
+    tpoa = np.where(sunup, beam * get_cover_transmittance(aoi) + poa_sky * get_cover_transmittance(theta_sky) + poa_ground * get_cover_transmittance(theta_ground), 0)
+
+    return np.maximum(poa, 0), np.maximum(tpoa, 0)
+
+def get_convection_coefficient(tave, windmod, temp_delta, xlen, tilt, check_reynold):
+    # free, laminar and turbulent convection (Fuentes 1987), see pvlib.temperature._fuentes_hconv
+    densair = 0.003484 * 101325.0 / tave
+    visair = 0.24237e-6 * tave ** 0.76 / densair
+    condair = 2.1695e-4 * tave ** 0.84
+    reynold = windmod * xlen / visair
+    hforce = 0.8600 / reynold ** 0.5 * densair * windmod * 1007 / 0.71 ** 0.67
+    if check_reynold:
+        hforce = np.where(reynold > 1.2e5, 0.0282 / reynold ** 0.2 * densair * windmod * 1007 / 0.71 ** 0.4, hforce)
+    grashof = 9.8 / tave * temp_delta * xlen ** 3 / visair ** 2 * np.sin(np.radians(tilt))
+    hfree = 0.21 * (grashof * 0.71) ** 0.32 * condair / xlen
+    return (hfree ** 3 + hforce ** 3) ** (1 / 3)
+
+def get_cell_temperature_batch(poa, temperature, windSpeed, tilt, noct=NOCT):
+    """ Fuentes module temperature model used by PVWatts, stepped through the year for all cells at once
+
+    Same as pvlib.temperature.fuentes, except the module is back at ambient temperature whenever there is no irradiance, as in SAM.
+
+    ...
+
+    Args:
+    ----------
+    `poa` (np array): hourly plane of array irradiance (W/m2), shape (cells, hours)
+
+    `temperature` (np array): hourly ambient temperature (C)
+
+    `windSpeed` (np array): hourly wind speed (m/s)
+
+    `tilt` (np array): tilt of each cell's array (degrees)
+
+    `noct` (float): installed nominal operating cell temperature (C)
+
+    Returns:
+    ----------
+    `cell_temperature` (np array): hourly cell temperature (C)
+
+    """
+    boltz = 5.669e-8
+    emiss = 0.84
+    absorp = 0.83
+    xlen = 2 * 0.31579 * 1.2 / (0.31579 + 1.2) # hydraulic diameter of the module
+    cap = 11000 # J/(m2 K), noct below 48 C so no racking thermal mass
+    tilt = np.asarray(tilt, dtype=float).reshape(-1)
+    tinoct = noct + 273.15
+
+    # ground temperature and convection ratios at NOCT
+    hconv = get_convection_coefficient((tinoct + 293.15) / 2, 1.0, tinoct - 293.15, xlen, tilt, False)
+    hground = emiss * boltz * (tinoct ** 2 + 293.15 ** 2) * (tinoct + 293.15)
+    backrat = (absorp * 800.0 - emiss * boltz * (tinoct ** 4 - 282.21 ** 4) - hconv * (tinoct - 293.15)) / ((hground + hconv) * (tinoct - 293.15))
+    tground = np.clip((tinoct ** 4 - backrat * (tinoct ** 4 - 293.15 ** 4)) ** 0.25, 293.15, tinoct)
+    tgrat = (tground - 293.15) / (tinoct - 293.15)
+    convrat = (absorp * 800 - emiss * boltz * (2 * tinoct ** 4 - 282.21 ** 4 - tground ** 4)) / (hconv * (tinoct - 293.15))
+
+    tamb_array = temperature + 273.15
+    sun_array = poa * absorp
+    tsky_array = 0.68 * (0.0552 * tamb_array ** 1.5) + 0.32 * tamb_array
+    windmod_array = windSpeed * (5 / 9.144) ** 0.2 + 1e-4 # module at 5 m, wind measured at 9.144 m
+    lit = poa > 0
+
+    cell_temperature = np.array(tamb_array)
+    tmod0 = np.full(poa.shape[0], 293.15)
+    sun0 = np.zeros(poa.shape[0])
+    for hour in range(poa.shape[1]):
+        tamb = tamb_array[:, hour]
+        sun = sun_array[:, hour]
+        if lit[:, hour].any():
+            windmod = windmod_array[:, hour]
+            tsky = tsky_array[:, hour]
+            tmod = tmod0
+            for iteration in range(10):
+                tmod_previous = tmod
+                hconv = convrat * get_convection_coefficient((tmod + tamb) / 2, windmod, np.abs(tmod - tamb), xlen, tilt, True)
+                hsky = emiss * boltz * (tmod ** 2 + tsky ** 2) * (tmod + tsky)
+                tground = tamb + tgrat * (tmod - tamb)
+                hground = emiss * boltz * (tmod ** 2 + tground ** 2) * (tmod + tground)
+                eigen = -(hconv + hsky + hground) / cap * 3600
+                ex = np.where(eigen > -10, np.exp(eigen), 0)
+                tmod = tmod0 * ex + ((1 - ex) * (hconv * tamb + hsky * tsky + hground * tground + sun0 + (sun - sun0) / eigen) + sun - sun0) / (hconv + hsky + hground)
+                # the heat loss terms depend on tmod, stop once it no longer changes
+                if np.abs(tmod - tmod_previous).max() < 1e-6:
+                    break
+            tmod = np.where(lit[:, hour], tmod, tamb)
+        else:
+            tmod = tamb
+        cell_temperature[:, hour] = tmod
+        tmod0 = tmod
+        sun0 = sun
+
+    return cell_temperature - 273.15
+
+def run_solar_batch(times, latitudes, longitudes, dni, dhi, windSpeed, temperature, dc_ac_ratio=1.1, inv_eff=96, losses=14):
+    """ NumPy version of run_solar for many cells at once (fixed open rack facing south, tilted at the latitude)
+
+    ...
+
+    Args:
+    ----------
+    `times` (DatetimeIndex): hourly time index (UTC) of the resource data, 24 hours per day
+
+    `latitudes`, `longitudes` (np array): location of each cell in degrees
+
+    `dni`, `dhi`, `windSpeed`, `temperature` (np array): hourly resource data, shape (cells, hours)
+
+    `dc_ac_ratio` (float): DC to AC ratio
+
+    `inv_eff` (float): inverter efficiency at rated power (%)
+
+    `losses` (float): other DC losses (%)
+
+    Returns:
+    ----------
+    `output_cf` (np array): hourly capacity factors (AC generation over DC nameplate), shape (cells, hours)
+
+    """
+    tilt = np.abs(np.asarray(latitudes, dtype=float))
+    dni = np.asarray(dni, dtype=float)
+    dhi = np.asarray(dhi, dtype=float)
+    temperature = np.asarray(temperature, dtype=float)
+
+    zenith, azimuth, sunup = get_solar_position(times, latitudes, longitudes, temperature)
+    poa, tpoa = get_poa_batch(times, tilt, dni, dhi, zenith, azimuth, sunup)
+    cell_temperature = get_cell_temperature_batch(poa, temperature, np.asarray(windSpeed, dtype=float), tilt)
+
+    # DC output per unit of nameplate, then the PVWatts inverter
+    dc = np.maximum(tpoa / 1000 * (1 + GAMMA * (cell_temperature - 25)) * (1 - losses / 100.), 0)
+    eta_inv = inv_eff / 100.
+    ac = pvlib.inverter.pvwatts(dc, 1 / dc_ac_ratio / eta_inv, eta_inv_nom=eta_inv, eta_inv_ref=0.9637)
+    output_cf = np.maximum(np.nan_to_num(ac), 0)
+
+    return output_cf
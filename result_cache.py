@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#content addressed cache of the simulated capacity factors of single cells, so reruns after a change only simulate what it affects
+#a result is stored under a hash of everything it was computed from (technology, year, the technology's parameters, the cell's
+#position and its weather), so results of unchanged cells are found again and changed inputs can never return a stale result
+
+import numpy as np
+import hashlib
+import json
+import os
+
+def get_parameters_hash(parameters):
+    # parameters is a dict of settings, arrays are hashed by value
+    encoded = json.dumps(parameters, sort_keys=True, default=lambda value: np.asarray(value).tolist())
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def get_key(technology, year, parameters_hash, latitude, longitude, arrays):
+    """ Hash of one cell's inputs to a technology
+
+    ...
+
+    Args:
+    ----------
+    `technology` (str): 'solar' or 'wind'
+
+    `year` (int): year of the resource data
+
+    `parameters_hash` (str): get_parameters_hash of the technology's parameter set
+
+    `latitude`, `longitude` (float): position of the cell in degrees
+
+    `arrays` (list): the cell's hourly weather (and any per cell setting, e.g. its turbine curve) the result depends on
+
+    Returns:
+    ----------
+    `key` (str): hex digest identifying the result
+    """
+    sha = hashlib.sha256()
+    sha.update(('%s:%d:%s:%r:%r' % (technology, year, parameters_hash, float(latitude), float(longitude))).encode())
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        sha.update(str(values.dtype).encode() + str(values.shape).encode())
+        sha.update(values.tobytes())
+    return sha.hexdigest()
+
+class ResultCache:
+    """ Capacity factors of single cells stored by key as .npy files, in float32 like the output files
+
+    ...
+
+    Args:
+    ----------
+    `cache_directory` (str): folder of the cache, shared by every run, year and technology of a region
+
+    """
+
+    def __init__(self, cache_directory):
+        self.cache_directory = cache_directory
+        self.hits = 0
+        self.misses = 0
+
+    def get_file_name(self, key):
+        # two levels of folders keep the number of files per folder small
+        return os.path.join(self.cache_directory, key[:2], key + '.npy')
+
+    def get(self, key):
+        # cached values of key, None if they were never stored
+        file_name = self.get_file_name(key)
+        try:
+            values = np.load(file_name)
+        except (OSError, ValueError):
+            # missing, or a file some other writer has not finished renaming yet
+            self.misses += 1
+            return None
+        self.hits += 1
+        return values
+
+    def put(self, key, values):
+        # written to a temporary file first so tasks sharing the cache never read a partial result
+        file_name = self.get_file_name(key)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        temp_file = '%s.%d.tmp.npy' % (file_name[:-4], os.getpid())
+        np.save(temp_file, np.asarray(values, dtype='f4'))
+        os.replace(temp_file, file_name)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#simulates several solar and wind designs of a region in one pass: the resource of each tile is read and decomposed into dni/dhi once,
+#the SAM resource of each cell is built once, and every configuration is evaluated on it (each with its own pooled SAM model).
+#every configuration is written as its own cf variable, cf_<name>, of the year's solar and wind files in the sweep folder
+#usage: python sweep.py <year> <region> <configurations.json> [--in-memory] [--workers N] [--tile-size N] [--destination DIR]
+#
+#configurations.json lists the designs, settings left out keep powGen's defaults, e.g.
+#{"solar": [{"name": "latitude_tilt"}, {"name": "south_20", "tilt": 20, "dc_ac_ratio": 1.3}],
+# "wind": [{"name": "iec_class"}, {"name": "class2_hub85", "turbine": "Composite IEC Class II", "hub_height": 85, "rotor_diameter": 110}]}
+
+import numpy as np
+import os
+import re
+import json
+import argparse
+import datetime
+import multiprocessing
+from netCDF4 import Dataset
+import powGen_impl_beta as powGen
+import asset_cache
+import metrics
+
+# hub heights SAM accepts with the resource's wind direction at 50 m: the direction must be measured within 10 m of the hub
+# and the speed within 35 m, lower hubs pick the 10 m speed with the 50 m direction and fail like higher ones
+MIN_HUB_HEIGHT = 40
+MAX_HUB_HEIGHT = 85
+
+def check_configurations(solar_configs, wind_configs, power_curve=None):
+    # every configuration needs a name usable as a netcdf variable and only settings powGen can set (see powGen_impl_beta.SOLAR_CONFIG_PARAMETERS)
+    for technology, configs, parameters in [('solar', solar_configs, powGen.SOLAR_CONFIG_PARAMETERS), ('wind', wind_configs, powGen.WIND_CONFIG_PARAMETERS)]:
+        names = set()
+        for config in configs:
+            name = config.get('name')
+            if not isinstance(name, str) or re.fullmatch('[A-Za-z0-9_]+', name) is None:
+                raise ValueError('%s configuration %r needs a name of letters, digits and underscores' % (technology, config))
+            if name in names:
+                raise ValueError('%s configuration name %s is used twice' % (technology, name))
+            names.add(name)
+            unknown = [setting for setting in config if setting != 'name' and setting not in parameters]
+            if len(unknown) > 0:
+                raise ValueError('%s configuration %s has unknown settings %s, allowed are %s' % (technology, name, unknown, sorted(parameters)))
+            if technology == 'wind' and power_curve is not None and config.get('turbine') is not None and config['turbine'] not in power_curve:
+                raise ValueError('wind configuration %s uses turbine %s, the power curves are %s' % (name, config['turbine'], sorted(power_curve)))
+            # checked here so a sweep SAM would stop part way through never creates its output files
+            if technology == 'wind' and config.get('hub_height') is not None and not MIN_HUB_HEIGHT <= config['hub_height'] <= MAX_HUB_HEIGHT:
+                raise ValueError('wind configuration %s has a hub height of %s m, SAM needs %d to %d m with the 50 m MERRA winds' % (name, config['hub_height'], MIN_HUB_HEIGHT, MAX_HUB_HEIGHT))
+    if len(solar_configs) + len(wind_configs) == 0:
+        raise ValueError('no configurations to simulate')
+
+def load_configurations(configuration_file):
+    # solar and wind configurations of a json file {"solar": [...], "wind": [...]}
+    with open(configuration_file) as f:
+        configurations = json.load(f)
+    solar_configs = configurations.get('solar', [])
+    wind_configs = configurations.get('wind', [])
+    check_configurations(solar_configs, wind_configs)
+    return solar_configs, wind_configs
+
+def get_variable_name(config):
+    return 'cf_' + config['name']
+
+def compute_sweep_tile(year, lat, lon, tile_start, tile_stop, tile_data, wind_IEC_class, power_curve, solar_configs, wind_configs, in_memory=False):
+    """ Evaluates every configuration on the cells of a tile read by powGen_impl_beta.read_tile
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year of the resource data
+
+    `lat`, `lon` (np array): latitudes and longitudes of the region
+
+    `tile_start`, `tile_stop` (int): range of cells of the tile (cell = latitude * num_lons + longitude)
+
+    `tile_data` (tuple): resource and sun position of the tile from read_tile
+
+    `wind_IEC_class` (DataFrame): IEC wind class of each cell
+
+    `power_curve` (dict): power curves from get_power_curve
+
+    `solar_configs`, `wind_configs` (list): configurations (see check_configurations)
+
+    `in_memory` (bool): pass resource data to SAM directly instead of writing csv/srw files
+
+    Returns:
+    ----------
+    `tile_lats`, `tile_lons` (np array): latitude and longitude indices of the cells
+
+    `solar_outputs`, `wind_outputs` (np array): hourly capacity factors, shape (cells, configurations, 8760)
+
+    """
+    tile_lats, tile_lons = powGen.get_cell_indices(tile_start, tile_stop, lon.size)
+    (ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection), tile_geometry = tile_data
+    num_cells, num_hours = ghi.shape
+
+    wind_classes = np.array([int(wind_IEC_class[longitude][latitude]) for latitude, longitude in zip(tile_lats, tile_lons)])
+
+    # decomposed once for every solar configuration
+    dni = dhi = np.zeros(ghi.shape)
+    if len(solar_configs) > 0:
+        with metrics.stage('decompose'):
+            dni, dhi = powGen.get_dni_dhi_batch(year, lat[tile_lats], lon[tile_lons], ghi, tile_geometry) #dirint model
+
+    solar_outputs = np.zeros((num_cells, len(solar_configs), num_hours))
+    wind_outputs = np.zeros((num_cells, len(wind_configs), num_hours))
+    for cell in range(num_cells):
+        latitude = lat[tile_lats[cell]]
+        longitude = lon[tile_lons[cell]]
+        solar_resource, wind_resource = powGen.get_cell_resource(year, latitude, longitude, dni[cell], dhi[cell], temperature[cell], pressure[cell],
+            windSpeed2[cell], windSpeed10[cell], windSpeed50[cell], windDirection[cell], in_memory, len(solar_configs) > 0, len(wind_configs) > 0)
+        with metrics.stage('solar'):
+            for index, config in enumerate(solar_configs):
+                solar_outputs[cell, index] = powGen.run_solar(solar_resource, latitude, config)
+        with metrics.stage('wind'):
+            for index, config in enumerate(wind_configs):
+                wind_outputs[cell, index] = powGen.run_wp(wind_resource, wind_classes[cell], power_curve, config)
+        powGen.remove_cell_resource(solar_resource, wind_resource)
+
+    return tile_lats, tile_lons, solar_outputs, wind_outputs
+
+# per process state of pool workers, set once by init_sweep_worker
+sweep_state = dict()
+
+def init_sweep_worker(lat, lon, wind_IEC_class, power_curve, solar_configs, wind_configs, in_memory, solar_geometry_file=None):
+    sweep_state['processed_merra_file'] = None
+    sweep_state['merra_data'] = None
+    sweep_state['solar_geometry'] = Dataset(solar_geometry_file) if solar_geometry_file is not None else None
+    sweep_state['lat'] = lat
+    sweep_state['lon'] = lon
+    sweep_state['wind_IEC_class'] = wind_IEC_class
+    sweep_state['power_curve'] = power_curve
+    sweep_state['solar_configs'] = solar_configs
+    sweep_state['wind_configs'] = wind_configs
+    sweep_state['in_memory'] = in_memory
+
+def run_sweep_tile(task):
+    # task is (year, processed MERRA file, tile), returned like powGen_impl_beta.run_worker_tile
+    year, processed_merra_file, tile = task
+    if sweep_state['processed_merra_file'] != processed_merra_file:
+        if sweep_state['merra_data'] is not None:
+            sweep_state['merra_data'].close()
+        sweep_state['merra_data'] = Dataset(processed_merra_file)
+        sweep_state['processed_merra_file'] = processed_merra_file
+    tile_data = powGen.read_tile(sweep_state['merra_data'], tile[0], tile[1], sweep_state['solar_geometry'])
+    tile_outputs = compute_sweep_tile(year, sweep_state['lat'], sweep_state['lon'], tile[0], tile[1], tile_data, sweep_state['wind_IEC_class'], sweep_state['power_curve'],
+        sweep_state['solar_configs'], sweep_state['wind_configs'], sweep_state['in_memory'])
+    return (tile,) + tile_outputs + (metrics.pop_stage_times(),)
+
+def sweep_year(year, processed_merra_file, destination, lat, lon, wind_IEC_class, power_curve, solar_configs, wind_configs, pool=None, solar_geometry_file=None,
+    in_memory=False, tile_size=256, chunk_shape=None, complevel=0, cell_range=None, metrics_file=None, summary_interval=60., run_info=None):
+    """ Simulates every configuration for one year of a region and writes one cf variable per configuration
+
+    ...
+
+    Args:
+    ----------
+    `year` (int): year to simulate
+
+    `processed_merra_file` (str): processed MERRA file of the year
+
+    `destination` (str): folder of the sweep's capacity factor files (named like those of powGen_impl_beta)
+
+    `pool` (Pool): worker processes started by main (with init_sweep_worker), None simulates the tiles in this process
+
+    The remaining arguments are those of compute_sweep_tile and powGen_impl_beta.simulate_year.
+
+    """
+    technologies = [technology for technology, configs in zip(powGen.TECHNOLOGIES, [solar_configs, wind_configs]) if len(configs) > 0]
+    variables = {technology: [get_variable_name(config) for config in configs] for technology, configs in zip(powGen.TECHNOLOGIES, [solar_configs, wind_configs])}
+
+    num_cells = lat.size * lon.size
+    skip = np.zeros(num_cells, dtype=bool)
+    if cell_range is not None:
+        skip[:cell_range[0]] = True
+        skip[cell_range[1]:] = True
+
+    powGen.create_netCDF_files(year, lat, lon, destination, chunk_shape, complevel, technologies=technologies, variables=variables)
+    # settings of each configuration are kept with its variable (left out settings are powGen's defaults)
+    for technology, configs in zip(powGen.TECHNOLOGIES, [solar_configs, wind_configs]):
+        if len(configs) > 0:
+            data = Dataset(powGen.get_cf_file_name(year, technology, destination), 'a')
+            for config in configs:
+                data.variables[get_variable_name(config)].configuration = json.dumps(config)
+            data.close()
+    cf_writer = powGen.CFWriter(year, destination, technologies=technologies, variables=variables)
+
+    run_info = dict(run_info or {}, year=year)
+    metrics_log = metrics.MetricsLog(int((~skip).sum()), metrics_file, summary_interval, run_info)
+
+    tiles = powGen.get_tiles(num_cells, tile_size, skip)
+    if pool is not None:
+        tile_results = pool.imap_unordered(run_sweep_tile, [(year, processed_merra_file, tile) for tile in tiles])
+    else:
+        merra_data = Dataset(processed_merra_file)
+        solar_geometry = Dataset(solar_geometry_file) if solar_geometry_file is not None else None
+        tile_results = ((tile,) + compute_sweep_tile(year, lat, lon, tile[0], tile[1], powGen.read_tile(merra_data, tile[0], tile[1], solar_geometry),
+            wind_IEC_class, power_curve, solar_configs, wind_configs, in_memory) + (metrics.pop_stage_times(),) for tile in tiles)
+
+    for tile_result in tile_results:
+        powGen.write_tile(cf_writer, metrics_log, tile_result)
+
+    if pool is None:
+        merra_data.close()
+        if solar_geometry is not None:
+            solar_geometry.close()
+    cf_writer.close()
+    metrics_log.close()
+
+def main(year, region, solar_configs, wind_configs, in_memory=False, tile_size=256, workers=1, destination=None, chunk_shape=None, complevel=0,
+    cell_range=None, metrics_file=None, summary_interval=60., use_geometry_cache=True):
+    print('Begin Sweep: \t {:%Y-%m-%d %H:%M:%S}'.format(datetime.datetime.now()))
+
+    root_directory = '/scratch/mtcraig_root/mtcraig1/shared_data/'
+    processed_merra_path = root_directory + 'merraData/resource/' + region + '/processed/'
+    processed_merra_file = powGen.get_processed_merra_file(processed_merra_path, region, year)
+    if destination is None:
+        destination = root_directory + 'merraData/cfs/' + region + '/sweep/'
+    os.makedirs(destination, exist_ok=True)
+
+    lat, lon = powGen.get_lat_lon(processed_merra_file)
+    power_curve = powGen.get_power_curve(root_directory + 'powGen/wind_turbine_power_curves.xlsx')
+    wind_IEC_class = asset_cache.read_excel_cached(root_directory + 'powGen/IEC_wind_class_' + region + '.xlsx', index_col=0)
+    check_configurations(solar_configs, wind_configs, power_curve)
+
+    solar_geometry_file = None
+    if use_geometry_cache and len(solar_configs) > 0:
+        merra_data = Dataset(processed_merra_file)
+        num_days = merra_data.variables['SWGDN'].shape[1]
+        merra_data.close()
+        solar_geometry_file = powGen.get_solar_geometry_file(processed_merra_path, region, lat, lon, num_days)
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=init_sweep_worker, initargs=(lat, lon, wind_IEC_class, power_curve, solar_configs, wind_configs, in_memory, solar_geometry_file))
+
+    run_info = {'region': region, 'workers': workers, 'tile_size': tile_size, 'in_memory': in_memory,
+        'solar_configs': solar_configs, 'wind_configs': wind_configs}
+    try:
+        sweep_year(year, processed_merra_file, destination, lat, lon, wind_IEC_class, power_curve, solar_configs, wind_configs, pool, solar_geometry_file,
+            in_memory, tile_size, chunk_shape, complevel, cell_range, metrics_file, summary_interval, run_info)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate several solar and wind configurations of a region in one pass over its resource')
+    parser.add_argument('year', type=int)
+    parser.add_argument('region')
+    parser.add_argument('configurations', help='json file with the "solar" and "wind" configurations')
+    parser.add_argument('--in-memory', action='store_true', help='pass resource data to SAM directly instead of writing csv/srw files')
+    parser.add_argument('--tile-size', type=int, default=256, help='number of cells read from the processed MERRA file at once')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes simulating tiles in parallel')
+    parser.add_argument('--destination', default=None, help='folder of the output files (merraData/cfs/<region>/sweep/ by default)')
+    parser.add_argument('--chunk-shape', type=int, nargs=3, default=None, metavar=('LAT', 'LON', 'HOUR'), help='chunk sizes of the cf output variables')
+    parser.add_argument('--complevel', type=int, default=0, help='zlib compression level of the cf output variables (0 is off)')
+    parser.add_argument('--cell-range', type=int, nargs=2, default=None, metavar=('START', 'STOP'), help='only simulate cells START:STOP of the processed vector')
+    parser.add_argument('--metrics', default=None, help='json-lines file stage times, peak memory and progress summaries are appended to')
+    parser.add_argument('--summary-interval', type=float, default=60., help='seconds between printed progress summaries')
+    parser.add_argument('--no-geometry-cache', action='store_true', help='compute the sun position of every tile instead of reading the region\'s solar geometry table')
+    args = parser.parse_args()
+
+    solar_configs, wind_configs = load_configurations(args.configurations)
+    main(args.year, args.region, solar_configs, wind_configs, args.in_memory, args.tile_size, args.workers, args.destination, args.chunk_shape, args.complevel,
+        args.cell_range, args.metrics, args.summary_interval, not args.no_geometry_cache)
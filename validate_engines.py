@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+#compares the vectorized numpy engines of powGen_impl_beta against SAM on a sample of cells from a processed MERRA file,
+#reports how closely they agree and how long each takes per cell so the engine can be picked for a run
+#usage: python validate_engines.py <processed MERRA file> <year> [--cells N] [--engines solar wind] [--power-curves xlsx] [--batch-size N] [--output report.csv]
+
+import numpy as np
+import os
+import time
+import argparse
+import pandas as pd
+from netCDF4 import Dataset
+import powGen_impl_beta as powGen
+import pvwatts_engine
+
+def get_sample_cells(num_cells, sample_size):
+    # evenly spaced over the processed vector so the sample covers the whole region
+    return np.unique(np.linspace(0, num_cells - 1, min(sample_size, num_cells)).astype(int))
+
+def compare_outputs(engine, sam_outputs, engine_outputs):
+    # agreement of one cell's hourly capacity factors
+    difference = engine_outputs - sam_outputs
+    return {'engine': engine,
+            'sam_cf': sam_outputs.mean(),
+            'engine_cf': engine_outputs.mean(),
+            'annual_energy_diff_pct': 100. * difference.sum() / sam_outputs.sum() if sam_outputs.sum() > 0 else 0.,
+            'max_hourly_abs_diff': np.abs(difference).max(),
+            'rmse': np.sqrt((difference ** 2).mean())}
+
+def validate_solar(year, merra_data, lat, lon, cells, batch_size):
+    # only the sampled cells are read, one at a time as in validate_wind, they are spread over the whole region
+    tiles = [powGen.get_tile_data(merra_data, cell, cell + 1) for cell in cells]
+    ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = [np.concatenate(values) for values in zip(*tiles)]
+    latitudes, longitudes = np.divmod(cells, lon.size)
+    latitudes, longitudes = lat[latitudes], lon[longitudes]
+    dni, dhi = powGen.get_dni_dhi_batch(year, latitudes, longitudes, ghi)
+
+    # SAM the way main runs it (resource csv files), one cell at a time
+    start = time.time()
+    sam_outputs = []
+    for cell in range(cells.size):
+        solar_csv = powGen.create_csv(year, latitudes[cell], longitudes[cell])
+        for jd in range(int(dni.shape[1] / 24)):
+            month, day = powGen.get_date(jd + 1)
+            hours = slice(jd * 24, (jd + 1) * 24)
+            powGen.write_day2csv(solar_csv, year, month, day, dni[cell, hours], dhi[cell, hours], windSpeed2[cell, hours], temperature[cell, hours])
+        sam_outputs.append(powGen.run_solar(solar_csv, latitudes[cell]))
+        os.remove(solar_csv)
+    sam_time = (time.time() - start) / cells.size
+
+    times = powGen.get_annual_date_time_index(year, int(dni.shape[1] / 24))
+    engine_outputs = pvwatts_engine.run_solar_batch(times, latitudes, longitudes, dni, dhi, windSpeed2, temperature)
+
+    # the engine's hour loop is a fixed cost per call, so it is timed on a tile sized batch built from the sample
+    batch = np.resize(np.arange(cells.size), batch_size)
+    start = time.time()
+    pvwatts_engine.run_solar_batch(times, latitudes[batch], longitudes[batch], dni[batch], dhi[batch], windSpeed2[batch], temperature[batch])
+    engine_time = (time.time() - start) / batch_size
+
+    rows = []
+    for cell in range(cells.size):
+        row = {'lat': latitudes[cell], 'lon': longitudes[cell], 'wind_class': np.nan}
+        row.update(compare_outputs('solar', np.asarray(sam_outputs[cell]), engine_outputs[cell]))
+        rows.append(row)
+    return rows, sam_time, engine_time
+
+def validate_wind(year, merra_data, lat, lon, cells, power_curve):
+    # the numpy engine keeps its own copy of SAM's losses
+    sam_losses = powGen.create_wind_model().Losses.export()
+    for name in sorted(set(sam_losses) | set(powGen.WIND_LOSSES)):
+        if sam_losses.get(name, 0.) != powGen.WIND_LOSSES.get(name, 0.):
+            print('Warning: wind loss %s is %s in SAM and %s in WIND_LOSSES' % (name, sam_losses.get(name), powGen.WIND_LOSSES.get(name)))
+
+    rows = []
+    sam_time = 0.
+    engine_time = 0.
+    for cell in cells:
+        latitude, longitude = divmod(int(cell), lon.size)
+        ghi, temperature, pressure, windSpeed2, windSpeed10, windSpeed50, windDirection = powGen.get_tile_data(merra_data, cell, cell + 1)
+        wind_resource = powGen.get_wind_resource_data(year, lat[latitude], lon[longitude], temperature[0], pressure[0],
+            windSpeed2[0], windSpeed10[0], windSpeed50[0], windDirection[0])
+
+        # every onshore turbine class is checked at every sampled cell
+        for wind_class in [1, 2, 3]:
+            start = time.time()
+            sam_outputs = np.array(powGen.run_wp(wind_resource, wind_class, power_curve))
+            sam_time += time.time() - start
+
+            start = time.time()
+            engine_outputs = powGen.run_wp_batch(temperature, pressure, windSpeed50, [wind_class], power_curve)[0]
+            engine_time += time.time() - start
+
+            row = {'lat': lat[latitude], 'lon': lon[longitude], 'wind_class': wind_class}
+            row.update(compare_outputs('wind', sam_outputs, engine_outputs))
+            rows.append(row)
+    return rows, sam_time / len(rows), engine_time / len(rows)
+
+def main(processed_merra_file, year, sample_size, engines, power_curve_file, output_file=None, batch_size=256):
+    lat, lon = powGen.get_lat_lon(processed_merra_file)
+    cells = get_sample_cells(lat.size * lon.size, sample_size)
+
+    merra_data = Dataset(processed_merra_file)
+    rows = []
+    timing = []
+    if 'solar' in engines:
+        solar_rows, sam_time, engine_time = validate_solar(year, merra_data, lat, lon, cells, batch_size)
+        rows += solar_rows
+        timing.append({'engine': 'solar', 'sam_s_per_cell': sam_time, 'engine_s_per_cell': engine_time, 'speedup': sam_time / engine_time})
+    if 'wind' in engines:
+        wind_rows, sam_time, engine_time = validate_wind(year, merra_data, lat, lon, cells, powGen.get_power_curve(power_curve_file))
+        rows += wind_rows
+        timing.append({'engine': 'wind', 'sam_s_per_cell': sam_time, 'engine_s_per_cell': engine_time, 'speedup': sam_time / engine_time})
+    merra_data.close()
+
+    report = pd.DataFrame(rows)
+    pd.set_option('display.width', 200)
+    print(report.to_string(index=False))
+    print('\nWorst case per engine:')
+    print(report.groupby('engine')[['annual_energy_diff_pct', 'max_hourly_abs_diff', 'rmse']].agg(lambda x: x.abs().max()))
+    print('\nRun time per cell:')
+    print(pd.DataFrame(timing).to_string(index=False))
+
+    if output_file is not None:
+        report.to_csv(output_file, index=False)
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Validate the vectorized engines against SAM on a sample of cells')
+    parser.add_argument('processed_merra_file')
+    parser.add_argument('year', type=int)
+    parser.add_argument('--cells', type=int, default=10, help='number of cells sampled from the region')
+    parser.add_argument('--engines', nargs='+', choices=['solar', 'wind'], default=['solar', 'wind'], help='engines to validate')
+    parser.add_argument('--power-curves', default='wind_turbine_power_curves.xlsx', help='turbine power curve workbook')
+    parser.add_argument('--batch-size', type=int, default=256, help='cells per engine call when timing the solar engine, as in one tile')
+    parser.add_argument('--output', default=None, help='csv file the report is also written to')
+    args = parser.parse_args()
+
+    main(args.processed_merra_file, args.year, args.cells, args.engines, args.power_curves, args.output, args.batch_size)
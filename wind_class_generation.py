@@ -1,12 +1,56 @@
 import numpy as np
 import pandas as pd
 from netCDF4 import Dataset
-import seaborn as sns; sns.set()
-import matplotlib.pyplot as plt
 import os.path
 from datetime import datetime
+import asset_cache
 
-def main(yearList, latLength, longLength, excelFilePath, rawDataFilePath):
+def get_median_wind_speeds(rawData, cellChunk=1000):
+    """ Returns the median 100 meter wind speed of every cell in one year of raw MERRA data
+
+    ...
+
+    Args:
+    ----------
+    `rawData` (Dataset): opened cordData file for a single year, variables indexed [cell, day, hour]
+
+    `cellChunk` (int): amount of cells read at once, bounds memory use to a few hundred MB for a year of hourly data
+
+    Returns:
+    ----------
+    `medianWindSpeed` (ndarray): median hourly 100 meter wind speed of each cell, in the same order as the raw data
+    """
+
+    #used in calculating hourly wind shear value 
+    windScaleValue = np.log(50/10)
+
+    #getting 50 and 10 meter wind speeds in order to extrapolate to 100 meters where IEC values are measured
+    eastwardWind50 = rawData.variables["U50M"]
+    northwardWind50 = rawData.variables["V50M"]
+    eastwardWind10 = rawData.variables["U10M"]
+    northwardWind10 = rawData.variables["V10M"]
+
+    numCells = eastwardWind50.shape[0]
+    medianWindSpeed = np.zeros(numCells)
+    for start in range(0, numCells, cellChunk):
+        cells = slice(start, min(start + cellChunk, numCells))
+
+        #combine east and north values to get one single wind speed
+        finalWindSpeed50 = np.sqrt((eastwardWind50[cells]**2) + (northwardWind50[cells]**2))
+        finalWindSpeed10 = np.sqrt((eastwardWind10[cells]**2) + (northwardWind10[cells]**2))
+
+        #generating hourly time series for alpha using Time-Averaged Shear Exponent
+        wind_sheer = (np.log(finalWindSpeed50/finalWindSpeed10))/windScaleValue
+
+        #converting to final wind speed at 100 from 50 meters data measurement
+        finalWindSpeed100 = finalWindSpeed50 * (2 ** wind_sheer)
+
+        #papers talk about median giving more accurate estimations, taken over every day and hour of the year
+        medianWindSpeed[cells] = np.median(np.asarray(finalWindSpeed100).reshape(finalWindSpeed100.shape[0], -1), axis=1)
+
+    return medianWindSpeed
+
+def main(yearList, latLength, longLength, excelFilePath, rawDataFilePath, cellChunk=1000):
     """ Generates IEC wind class map based on 100 meter hub height wind speeds and returns file path written to
 
     ...
@@ -24,6 +68,8 @@ def main(yearList, latLength, longLength, excelFilePath, rawDataFilePath):
     `rawDataFilePath` (str): file path to where cordDataWestCoastYear or other regions raw data is located 
     (should be only beginning of file name and able to add years to end of str to load in raw data)
 
+    `cellChunk` (int): amount of cells read from the raw data at once (default 1000)
+
     Example:
         rawDataFilePath = 'cordDataWestCoastYear'
         loading data from: cordDataWestCoastYear2016, cordDataWestCoastYear2017...
@@ -34,10 +80,7 @@ def main(yearList, latLength, longLength, excelFilePath, rawDataFilePath):
 
     """
 
-    windSpeedArrayCul = np.zeros((latLength,longLength))
-
-    #used in calculating hourly wind shear value 
-    windScaleValue = np.log(50/10)
+    windSpeedArrayCul = np.zeros(latLength * longLength)
 
     #loading in array of offshore features in dataset will be setting IEC class to level 4 (value is 1 for offshore 0 not)
     offshoreBoundsFilePath = "offshore_MERRA_Format_Bounds.xlsx"
@@ -45,58 +88,20 @@ def main(yearList, latLength, longLength, excelFilePath, rawDataFilePath):
         error_message = 'No offshore MERRA format data, have you run generate_offshore_bounds?'
         raise RuntimeError(error_message)
     else:
-        offshoreBounds = pd.read_excel(offshoreBoundsFilePath,index_col=0).values
+        offshoreBounds = asset_cache.read_excel_cached(offshoreBoundsFilePath,index_col=0).values
 
-    #uses values available from 2016-18
+    #uses values available from 2016-18, one year in memory at a time
     for year in yearList:
         #may need to change file name for location of coord data not included in github due to file size
         fileName = rawDataFilePath + str(year) + ".nc"
         rawData = Dataset(fileName)
+        windSpeedArrayCul += get_median_wind_speeds(rawData, cellChunk)
+        rawData.close()
 
-        #getting 50 and 10 meter wind speeds in order to extrapolate to 100 meters where IEC values are measured
-        eastwardWind50 = rawData.variables["U50M"]
-        northwardWind50 = rawData.variables["V50M"]
-        eastwardWind10 = rawData.variables["U10M"]
-        northwardWind10 = rawData.variables["V10M"]
-
-        latLongIndex = 0
-        for lat in range(0,latLength):
-            for lon in range(0,longLength):
-
-                #if offshore wind speed subtract negative but later converted to IEC class level 4 for wind yet to be implemented, if not offshore continue
-                #with onshore calculations
-                if offshoreBounds[lat][lon] == 1:
-                    iecLevel = -1
-                    windSpeedArrayCul[lat][lon] += iecLevel
-                    latLongIndex += 1
-                    continue                    
-                #combine east and north values to get one single wind speed
-                finalWindSpeed50 = np.sqrt((eastwardWind50[latLongIndex][:][:]**2) + (northwardWind50[latLongIndex][:][:]**2))
-                finalWindSpeed10 = np.sqrt((eastwardWind10[latLongIndex][:][:]**2) + (northwardWind10[latLongIndex][:][:]**2))
-                
-                #generating hourly time series for alpha using Time-Averaged Shear Exponent
-                wind_sheer = (np.log(finalWindSpeed50/finalWindSpeed10))/windScaleValue
-    
+    windSpeedArrayCul = windSpeedArrayCul.reshape(latLength, longLength)
 
-                #converting to final wind speed at 100 from 50 meters data measurement
-                finalWindSpeed100 = finalWindSpeed50 * (2 ** wind_sheer)
-
-                #papers talk about median giving more accurate estimations
-                finalWindSpeed = np.median(finalWindSpeed100)
-
-                #used for assinging iec levels for each year, slow way, could use np.where instead, but easier to understand
-                '''
-                if finalWindSpeed >= 9:
-                    iecLevel = 1
-                elif finalWindSpeed >= 8:
-                    iecLevel = 2
-                elif finalWindSpeed >= 6.5:
-                    iecLevel = 3
-                elif finalWindSpeed:
-                    iecLevel = 0
-                '''
-                windSpeedArrayCul[lat][lon] += finalWindSpeed
-                latLongIndex += 1
+    #offshore wind speed is set negative so it is later converted to IEC class level 4 for wind yet to be implemented
+    windSpeedArrayCul = np.where(offshoreBounds[:latLength, :longLength] == 1, -len(yearList), windSpeedArrayCul)
 
     #finding mean for each lat long wind speed value for time period of years
     windSpeedArrayCul = windSpeedArrayCul / len(yearList)
@@ -120,8 +125,10 @@ def main(yearList, latLength, longLength, excelFilePath, rawDataFilePath):
     #transpose to set correct bounds for lat long
     windSpeedArrayCul = windSpeedArrayCul.T
 
-    #test ploting for debugging/visuals
+    #test ploting for debugging/visuals (seaborn and matplotlib are only imported here, they take seconds to load on every job)
     '''
+    import seaborn as sns; sns.set()
+    import matplotlib.pyplot as plt
     ax = sns.heatmap(windSpeedArrayCul)
     plt.ylabel("Long")
     plt.xlabel("Lat")